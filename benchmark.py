@@ -0,0 +1,522 @@
+"""
+Benchmarks of the analysis stages, and a bin-by-bin check that the fast paths
+give the same histograms as the plain scripts.
+
+Every stage runs in its own process on the events of one input (read before
+the clock starts, except for the read stages), and reports events/s, wall time
+and peak RSS:
+    read, read_cache        reader.iterate from the ROOT file / the column cache
+    match_nearest           closest reco photon of every gen photon, all pairs
+    match_grid              the same through the (eta, phi) grid (match_energy.py)
+    match_greedy/_optimal   one-to-one matching of the events (min_dr_threshold.py)
+    match_pairs/_table      pair matching of all the gen photon pairs, from the
+                            Delta R matrix / the match table (eratio.py, n_reco.py, ...)
+    pairing                 photon pairs, closest to the pi0 mass and best disjoint
+                            pairs (invariant_mass.py)
+    fill                    hists.fill of 1D and 2D histograms
+    analysis:<name>         process() of each script of run_analyses.py
+    producer                miniTreeForAnneMarie.py on edm4hep files (--producer)
+The inputs are the miniTree*.root files, or the ones given, copies with
+their events repeated (--scale) and synthetic miniTrees of any size
+(--synthetic, synthetic_minitree.py). The results are appended to
+benchmark_results.jsonl and compared with the last run of the same stage.
+
+--check runs the scripts of run_analyses.py with the column cache and/or the
+match table, and in chunks of --check-step-size events (chunks with photons on
+one side only, or no pair within the grid radius), and compares their
+histograms, and what the scripts accumulate besides them (their
+`accumulators`: counters, count arrays, lists), with those read from the ROOT
+file in the default chunks; --save-reference/--reference keep the histograms to
+compare later commits with. It also compares the batched matching, pairing and
+filling with the per-event loops of the original scripts (pi0tools/reference.py)
+on the histograms of what they compute.
+
+    python benchmark.py --scale 1 10
+    python benchmark.py -i miniTree.root --stages read read_cache pairing
+    python benchmark.py -i miniTree.root --synthetic 1000000 10000000 --stages read read_cache
+    python benchmark.py --check -i miniTree.root --reference reference.root
+"""
+import argparse
+import datetime
+import glob
+import json
+import multiprocessing
+import os
+import resource
+import shlex
+import shutil
+import subprocess
+import sys
+import time
+
+import awkward as ak
+import numpy as np
+import ROOT
+import uproot
+import run_analyses
+import sweep
+import synthetic_minitree
+from pi0tools import acceptance, colcache, driver, hists, kinematics, matching, matchtable, pairs, parentage, reader, reference
+from pi0tools.jagged import Jagged
+
+RESULTS = "benchmark_results.jsonl"
+BRANCHES = reader.vector_branches("photon", "genPhoton") + ["genPi0E", "genPi0M"]
+OPTIONAL = reader.vector_branches("photon", "genPhoton", components=reader.ANGLES) + parentage.BRANCHES
+PI0_MASS = 0.135  # GeV
+PI0_MASS_SIGMA = 0.010
+
+
+def _gen_pairs(batch):
+    table = pairs.PairTable.from_batch(batch, "genPhoton")
+    return table.first, table.second
+
+
+def _fill(batch):
+    hist = ROOT.TH1F("bench_fill", "", 100, 0, 5)
+    hist2d = ROOT.TH2F("bench_fill2d", "", 100, 0, 5, 100, -5, 5)
+    hists.fill(hist, batch["photonE"].content)
+    hists.fill(hist2d, batch["genPhotonE"].content, batch["genPhotonPx"].content)
+
+
+def _pairing(batch):
+    table = pairs.PairTable.from_batch(batch, "photon")
+    table.closest(PI0_MASS)
+    pairs.best_disjoint(table, PI0_MASS, PI0_MASS_SIGMA, max_pairs=batch["genPi0E"].counts)
+
+
+# name -> (function of a batch, needs the match table)
+STAGES = {
+    "match_nearest": (lambda batch: matching.nearest(matching.DeltaRMatrix.from_batch(batch)), False),
+    "match_grid": (lambda batch: matching.nearest(matching.DeltaRMatrix.from_batch(batch, radius=matching.DR_CUT)), False),
+    "match_greedy": (lambda batch: matching.greedy_match(matching.DeltaRMatrix.from_batch(batch)), False),
+    "match_optimal": (lambda batch: matching.optimal_match(matching.DeltaRMatrix.from_batch(batch)), False),
+    "match_pairs": (lambda batch: matching.match_pairs(batch, *_gen_pairs(batch)), False),
+    "match_pairs_table": (lambda batch: matchtable.match_pairs(batch, *_gen_pairs(batch)), True),
+    "pairing": (_pairing, False),
+    "fill": (_fill, False),
+}
+READ_STAGES = ["read", "read_cache"]
+ANALYSIS_STAGES = ["analysis:" + name for name in run_analyses.ANALYSES]
+
+
+def prepare(filename, workdir, scale):
+    """
+    The input of the benchmarks in workdir, its events repeated scale times,
+    with its column cache and match table.
+    """
+    os.makedirs(workdir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(filename))[0]
+    path = os.path.join(workdir, "{}_x{}.root".format(name, scale))
+    if scale == 1:
+        if os.path.lexists(path):
+            os.remove(path)
+        os.symlink(os.path.abspath(filename), path)
+    elif not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(filename):
+        with uproot.open(filename) as infile:
+            arrays = infile[reader.TREE_NAME].arrays(library="ak")
+        with uproot.recreate(path) as out:
+            out[reader.TREE_NAME] = {field: ak.concatenate([arrays[field]] * scale) for field in arrays.fields}
+    if colcache.load(path) is None:
+        colcache.write(path)
+    if matchtable.find(path) is None:
+        matchtable.write(path)
+    return path
+
+
+def synthetic_input(n_events, workdir, cell_size):
+    """A synthetic miniTree of n_events in workdir, written the first time."""
+    os.makedirs(workdir, exist_ok=True)
+    path = os.path.join(workdir, "synthetic_{}_{:g}.root".format(n_events, cell_size))
+    if not os.path.exists(path):
+        synthetic_minitree.write(path + ".tmp", n_events, cell_size=cell_size)
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def _peak_rss_mb(who=resource.RUSAGE_SELF):
+    return resource.getrusage(who).ru_maxrss / 1024.0  # kB on Linux
+
+
+def run_stage(job):
+    """One stage on one input, in a fresh process: (events, wall time [s], peak RSS [MB])."""
+    stage, path, step_size, producer = job
+    ROOT.gROOT.SetBatch(True)
+    ROOT.TH1.AddDirectory(False)
+
+    if stage == "producer":
+        script, args = producer
+        workdir = os.path.abspath(path)
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.abspath(script)] + shlex.split(args) + ["-o", "bench_producer"],
+                       cwd=workdir, check=True, stdout=subprocess.DEVNULL)
+        wall = time.perf_counter() - start
+        return reader.num_entries(os.path.join(workdir, "bench_producer.root")), wall, _peak_rss_mb(resource.RUSAGE_CHILDREN)
+
+    if stage in READ_STAGES:
+        start = time.perf_counter()
+        n_events = sum(len(batch) for batch in reader.iterate(path, BRANCHES, step_size=step_size, optional=OPTIONAL,
+                                                              use_cache=stage == "read_cache"))
+        return n_events, time.perf_counter() - start, _peak_rss_mb()
+
+    if stage in STAGES:
+        function, with_table = STAGES[stage]
+        branches, optional = BRANCHES, OPTIONAL + matchtable.BRANCHES if with_table else OPTIONAL
+    else:
+        # the script as run alone on a file without match table
+        analysis = run_analyses.load(stage.split(":", 1)[1])
+        if hasattr(analysis, "start"):
+            analysis.start(path)
+        function, with_table = analysis.process, False
+        branches, optional = analysis.branches, getattr(analysis, "optional_branches", [])
+    friends = [(matchtable.find(path), matchtable.TREE_NAME)] if with_table else []
+    batches = list(reader.iterate(path, branches, step_size=step_size, optional=optional, friends=friends))
+    start = time.perf_counter()
+    for batch in batches:
+        function(batch)
+    return sum(len(batch) for batch in batches), time.perf_counter() - start, _peak_rss_mb()
+
+
+def _previous(results_file):
+    # last result of every (input, stage)
+    last = {}
+    if os.path.exists(results_file):
+        with open(results_file) as infile:
+            for line in infile:
+                record = json.loads(line)
+                last[record["input"], record["stage"]] = record
+    return last
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(inputs, stages, scales, workdir, step_size, results_file, producer=None):
+    previous = _previous(results_file)
+    run = {"date": datetime.datetime.now().isoformat(timespec="seconds"), "commit": _commit(),
+           "step_size": step_size}
+    context = multiprocessing.get_context("spawn")
+    print("{:36s} {:28s} {:>9s} {:>9s} {:>12s} {:>9s} {:>8s}".format(
+        "input", "stage", "events", "wall [s]", "events/s", "RSS [MB]", "vs last"))
+    jobs = []
+    for filename in inputs:
+        for scale in scales:
+            path = prepare(filename, workdir, scale)
+            jobs.extend((os.path.basename(path), stage, path) for stage in stages)
+    if producer is not None:
+        jobs.append(("producer " + producer[1], "producer", os.path.join(workdir, "producer")))
+        os.makedirs(os.path.join(workdir, "producer"), exist_ok=True)
+    with open(results_file, "a") as results:
+        for input_name, stage, path in jobs:
+            with context.Pool(1) as pool:
+                n_events, wall, rss = pool.apply(run_stage, ((stage, path, step_size, producer),))
+            record = dict(run, input=input_name, stage=stage, events=n_events, wall=wall,
+                          events_per_s=n_events / wall if wall > 0 else float("inf"), peak_rss_mb=rss)
+            results.write(json.dumps(record) + "\n")
+            last = previous.get((input_name, stage))
+            change = "{:7.2f}x".format(record["events_per_s"] / last["events_per_s"]) if last else ""
+            print("{:36s} {:28s} {:9d} {:9.3f} {:12.0f} {:9.0f} {:>8s}".format(
+                input_name, stage, n_events, wall, record["events_per_s"], rss, change))
+    print("results appended to", results_file)
+
+
+def _histograms(directory, prefix=""):
+    found = {}
+    for key in directory.GetListOfKeys():
+        obj = key.ReadObj()
+        if isinstance(obj, ROOT.TDirectory):
+            found.update(_histograms(obj, prefix + key.GetName() + "/"))
+        elif isinstance(obj, ROOT.TH1):
+            found[prefix + key.GetName()] = np.array([obj.GetBinContent(i) for i in range(obj.GetNcells())])
+    return found
+
+
+def compare(file_a, file_b):
+    """Histograms of two files that differ (missing, other binning or bin contents), with the bins that differ."""
+    infile_a, infile_b = ROOT.TFile(file_a), ROOT.TFile(file_b)
+    hists_a, hists_b = _histograms(infile_a), _histograms(infile_b)
+    infile_a.Close()
+    infile_b.Close()
+    differences = []
+    for name in sorted(set(hists_a) | set(hists_b)):
+        a, b = hists_a.get(name), hists_b.get(name)
+        if a is None or b is None or len(a) != len(b):
+            differences.append((name, None))
+        elif not np.array_equal(a, b):
+            differences.append((name, int(np.count_nonzero(a != b))))
+    return differences
+
+
+ACCUMULATORS_FILE = "accumulators.json"
+
+
+def _accumulated(analysis):
+    # the accumulators of a script as lists of numbers, except the "last" ones (seen through the histograms)
+    state = {}
+    for name, rule in getattr(analysis, "accumulators", {}).items():
+        value = getattr(analysis, name)
+        if rule == "events":
+            value = {column: np.concatenate([chunk[column] for chunk in value]) for column in value[0]} if value else {}
+            state[name] = {column: array.tolist() for column, array in value.items()}
+        elif rule != "last":
+            state[name] = np.asarray(value).tolist()
+    return state
+
+
+def compare_accumulators(histogram_file_a, histogram_file_b):
+    """Accumulators that differ between the runs of two check variants, like compare()."""
+    states = []
+    for histogram_file in (histogram_file_a, histogram_file_b):
+        with open(os.path.join(os.path.dirname(histogram_file), ACCUMULATORS_FILE)) as infile:
+            states.append(json.load(infile))
+    differences = []
+    for analysis in sorted(set(states[0]) | set(states[1])):
+        a, b = states[0].get(analysis, {}), states[1].get(analysis, {})
+        differences.extend((analysis + "." + name, "values") for name in sorted(set(a) | set(b))
+                           if a.get(name) != b.get(name))
+    return differences
+
+
+# fast paths checked against reading the ROOT file: (column cache, match table, small chunks)
+VARIANTS = {"root": (False, False, False), "cache": (True, False, False), "table": (False, True, False),
+            "cache_table": (True, True, False), "small_chunks": (False, False, True),
+            "small_chunks_table": (False, True, True)}
+
+
+def run_variant(job):
+    """The scripts on one file with a given chunk size, headless: their histograms file, accumulators next to it."""
+    path, names, variant_dir, step_size = job
+    os.chdir(variant_dir)
+    ROOT.gROOT.SetBatch(True)
+    ROOT.TH1.AddDirectory(False)
+    analyses = [run_analyses.load(name) for name in names]
+    driver.run(path, analyses, step_size=step_size, plots=False)
+    driver.save(sweep.HISTOGRAM_FILE, names, analyses)
+    with open(ACCUMULATORS_FILE, "w") as outfile:
+        json.dump({name: _accumulated(analysis) for name, analysis in zip(names, analyses)}, outfile)
+    return os.path.join(variant_dir, sweep.HISTOGRAM_FILE)
+
+
+def check_one_sided():
+    """True if nearest() leaves every photon unmatched when the other side has none, both ways."""
+    eta, phi = Jagged([0, 2, 2], [0.1, -0.3]), Jagged([0, 2, 2], [1.0, 2.0])
+    empty = Jagged([0, 0, 0], np.zeros(0))
+    same = True
+    for radius in (None, matching.DR_CUT):
+        for targets, cands in (((eta, phi), (empty, empty)), ((empty, empty), (eta, phi))):
+            index, min_dr = matching.nearest(matching.DeltaRMatrix(*targets, *cands, radius=radius))
+            same &= len(index) == len(targets[0].content) and (index == -1).all() and np.isinf(min_dr).all()
+    print("{:40s} {}".format("nearest() with one side empty", "OK" if same else "FAILED"))
+    return same
+
+
+# quantities compared with the per-event loops: name -> (binning, values of a batch from the fast paths /
+# from the loops, given the inputs shared by both)
+def _shared(batch, theta_range):
+    gen_theta = kinematics.column(batch, "genPhoton", "Theta").content
+    has_pi0 = batch["genPi0E"].counts > 0
+    gen_pairs = pairs.PairTable.from_batch(batch, "genPhoton")
+    return {"gen_in_range": (gen_theta >= theta_range[0]) & (gen_theta <= theta_range[1]),
+            "has_pi0": has_pi0[batch["photonE"].event_index], "first": gen_pairs.first, "second": gen_pairs.second}
+
+
+def _nearest(batch, shared, fast):
+    if fast:
+        return matching.nearest(matching.DeltaRMatrix.from_batch(batch))
+    return reference.nearest(batch)
+
+
+def _nearest_grid(batch, shared, fast):
+    if fast:
+        return matching.nearest(matching.DeltaRMatrix.from_batch(batch, radius=matching.DR_CUT))
+    return reference.nearest(batch)
+
+
+def _greedy(batch, shared, fast):
+    # min_dr_threshold.py: reco photons to the gen photons in range, dropped if their nearest one is taken
+    if fast:
+        matrix = matching.DeltaRMatrix.from_batch(batch, targets="photon", candidates="genPhoton")
+        return matching.greedy_match(matrix, cut=None, target_mask=shared["has_pi0"], cand_mask=shared["gen_in_range"],
+                                     skip_used=False)
+    return reference.greedy_match(batch, "photon", "genPhoton", target_mask=shared["has_pi0"],
+                                  cand_mask=shared["gen_in_range"], skip_used=False)
+
+
+def _pair_matches(batch, shared, fast, use_grid=False):
+    if fast:
+        return matching.match_pairs(batch, shared["first"], shared["second"], use_grid=use_grid)[0]
+    return reference.match_pairs(batch, shared["first"], shared["second"], matching.DR_CUT)
+
+
+def _closest(batch, shared, fast):
+    if fast:
+        table = pairs.PairTable.from_batch(batch, "photon", scale=1e3)
+        best = table.closest(135)
+        best = best[best >= 0]
+        return table.mass[best], table.dr[best]
+    mass, dr = reference.closest_pairs(batch, 135, scale=1e3)
+    return mass[~np.isnan(mass)], dr[~np.isnan(dr)]
+
+
+def _mass_window_pairs(batch, shared, fast):
+    # the pairings of eratio.py, n_reco.py and match_energy_genpair.py: (passed, pi0s as a limit)
+    gen_e = batch["genPhotonE"].content
+    n_pi0 = batch["genPi0E"].counts
+    has_reco = batch["photonE"].counts[batch["genPhotonE"].event_index] > 0
+    settings = {"eratio": (shared["gen_in_range"] & (gen_e >= 0.2), n_pi0), "n_reco": (shared["gen_in_range"], n_pi0),
+                "genpair": (has_reco, None)}
+    found = {}
+    for name, (passed, max_pairs) in settings.items():
+        if fast:
+            table = pairs.PairTable.from_batch(batch, "genPhoton")
+            taken = pairs.mass_window_pairs(table, PI0_MASS, 0.05, passed, max_pairs=max_pairs)
+            first, second = table.first[taken], table.second[taken]
+        else:
+            first, second = reference.mass_window_pairs(batch, PI0_MASS, 0.05, passed, max_pairs=max_pairs)
+        found["mass_window_pairs_" + name] = (gen_e[first], gen_e[second])
+    return found
+
+
+def _values(batch, shared, fast):
+    index, dr = _nearest(batch, shared, fast)
+    _, grid_dr = _nearest_grid(batch, shared, fast)
+    greedy, greedy_dr = _greedy(batch, shared, fast)
+    gen_e, reco_e = batch["genPhotonE"].content, batch["photonE"].content
+    matched = greedy >= 0
+    pair_match = _pair_matches(batch, shared, fast)
+    pair_match_grid = _pair_matches(batch, shared, fast, use_grid=True) if fast else pair_match
+    mass, pair_dr = _closest(batch, shared, fast)
+    return {
+        "nearest_dr": (dr[np.isfinite(dr)],),
+        "nearest_reco_e": (reco_e[index[index >= 0]],),
+        "grid_matched_gen_e": (gen_e[grid_dr < matching.DR_CUT],),
+        "greedy_dr": (greedy_dr[matched],),
+        "greedy_ratio": (reco_e[matched] / gen_e[greedy[matched]],),
+        "pairs_n_matched": ((pair_match >= 0).sum(axis=1),),
+        "pairs_grid_n_matched": ((pair_match_grid >= 0).sum(axis=1),),
+        "pairs_reco_e": (reco_e[pair_match[pair_match >= 0]],),
+        "closest_mass_dr": (mass, pair_dr),
+        **_mass_window_pairs(batch, shared, fast),
+    }
+
+
+REFERENCE_BINNING = {
+    "nearest_dr": (100, 0, 0.2), "nearest_reco_e": (100, 0, 5), "grid_matched_gen_e": (100, 0, 5),
+    "greedy_dr": (100, 0, 0.1), "greedy_ratio": (100, 0, 2), "pairs_n_matched": (3, -0.5, 2.5),
+    "pairs_grid_n_matched": (3, -0.5, 2.5), "pairs_reco_e": (100, 0, 5), "closest_mass_dr": (150, 0, 300, 50, 0, 0.2),
+    "mass_window_pairs_eratio": (50, 0, 5, 50, 0, 5), "mass_window_pairs_n_reco": (50, 0, 5, 50, 0, 5),
+    "mass_window_pairs_genpair": (50, 0, 5, 50, 0, 5),
+}
+
+
+def check_reference(filename, step_size=reader.DEFAULT_STEP):
+    """True if the fast paths fill the same histograms as the per-event loops of the original scripts."""
+    ROOT.TH1.AddDirectory(False)
+    photon_acceptance = acceptance.read(filename)
+    theta_range = photon_acceptance["thetaMin"], photon_acceptance["thetaMax"]
+    booked = {}
+    for name, binning in REFERENCE_BINNING.items():
+        hist_class = ROOT.TH1D if len(binning) == 3 else ROOT.TH2D
+        booked[name] = [hist_class("{}_{}".format(name, path), name, *binning) for path in ("fast", "reference")]
+    branches = reader.vector_branches("photon", "genPhoton") + ["genPi0E"]
+    for batch in reader.iterate(filename, branches, step_size=step_size, use_cache=False):
+        shared = _shared(batch, theta_range)
+        fast, loops = _values(batch, shared, True), _values(batch, shared, False)
+        for name, (fast_hist, reference_hist) in booked.items():
+            hists.fill(fast_hist, *fast[name])
+            reference.fill(reference_hist, *loops[name])
+    differences = []
+    for name, (fast_hist, reference_hist) in booked.items():
+        bins = [np.array([hist.GetBinContent(i) for i in range(hist.GetNcells())]) for hist in (fast_hist, reference_hist)]
+        if not np.array_equal(*bins):
+            differences.append((name, int(np.count_nonzero(bins[0] != bins[1]))))
+    print("{:40s} {}".format("per-event reference", "IDENTICAL" if not differences
+                             else "{} histograms differ".format(len(differences))))
+    for name, n_bins in differences:
+        print("    {:60s} {} bins".format(name, n_bins))
+    return not differences
+
+
+def check(filename, workdir, names, reference_file=None, save_reference=None, step_size=1):
+    """True if every variant (and the reference, if given) has the histograms of the "root" one."""
+    context = multiprocessing.get_context("spawn")
+    histogram_files = {}
+    for variant, (with_cache, with_table, small_chunks) in VARIANTS.items():
+        variant_dir = os.path.join(os.path.abspath(workdir), "check", sweep.sample_name(filename), variant)
+        shutil.rmtree(variant_dir, ignore_errors=True)
+        os.makedirs(variant_dir)
+        path = os.path.join(variant_dir, os.path.basename(filename))
+        os.symlink(os.path.abspath(filename), path)
+        if with_cache:
+            colcache.write(path)
+        if with_table:
+            matchtable.write(path)
+        job = (path, names, variant_dir, step_size if small_chunks else reader.DEFAULT_STEP)
+        with context.Pool(1) as pool:
+            histogram_files[variant] = pool.apply(run_variant, (job,))
+
+    comparisons = [(variant, histogram_files["root"], histogram_files[variant]) for variant in VARIANTS if variant != "root"]
+    if reference_file is not None:
+        comparisons.append(("reference " + reference_file, reference_file, histogram_files["root"]))
+    same = True
+    for label, file_a, file_b in comparisons:
+        differences = compare(file_a, file_b)
+        if not label.startswith("reference"):
+            differences += compare_accumulators(file_a, file_b)
+        same &= not differences
+        print("{:40s} {}".format(label, "IDENTICAL" if not differences else "{} histograms differ".format(len(differences))))
+        for name, n_bins in differences:
+            print("    {:60s} {}".format(name, "missing or other binning" if n_bins is None
+                                          else "other values" if n_bins == "values" else "{} bins".format(n_bins)))
+    if save_reference is not None:
+        shutil.copyfile(histogram_files["root"], save_reference)
+        print("reference histograms saved in", save_reference)
+    return same
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analysis stages and check the fast paths",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-i", "--inputs", nargs="+", default=None, help="miniTree files (default: miniTree*.root)")
+    parser.add_argument("--stages", nargs="+", default=READ_STAGES + list(STAGES) + ANALYSIS_STAGES,
+                        choices=READ_STAGES + list(STAGES) + ANALYSIS_STAGES)
+    parser.add_argument("--scale", nargs="+", type=int, default=[1], help="times the events of each input are repeated")
+    parser.add_argument("--synthetic", nargs="+", type=int, default=[], metavar="EVENTS",
+                        help="also run on synthetic miniTrees of these sizes (synthetic_minitree.py)")
+    parser.add_argument("--synthetic-cell-size", type=float, default=0.005, help="cell size of the synthetic miniTrees [m]")
+    parser.add_argument("--step-size", type=int, default=reader.DEFAULT_STEP, help="events per chunk")
+    parser.add_argument("-o", "--results", default=RESULTS)
+    parser.add_argument("--workdir", default="benchmark")
+    parser.add_argument("--producer", default=None, metavar="ARGS",
+                        help="also time the producer with these arguments (e.g. \"-f sample -n 2\")")
+    parser.add_argument("--producer-script", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                  "miniTreeForAnneMarie.py"))
+    parser.add_argument("--check", action="store_true", help="compare the histograms of the fast paths instead")
+    parser.add_argument("-a", "--analyses", nargs="+", choices=list(run_analyses.ANALYSES),
+                        default=list(run_analyses.ANALYSES), help="scripts compared by --check")
+    parser.add_argument("--reference", default=None, help="histograms.root the --check histograms must equal")
+    parser.add_argument("--save-reference", default=None, help="save the --check histograms there")
+    parser.add_argument("--check-step-size", type=int, default=1, help="events per chunk of the small_chunks variant")
+    args = parser.parse_args()
+
+    inputs = args.inputs or sorted(glob.glob("miniTree*.root"))
+    inputs += [synthetic_input(n_events, args.workdir, args.synthetic_cell_size) for n_events in args.synthetic]
+    if not inputs:
+        parser.error("no miniTree*.root here, give the inputs with -i or --synthetic")
+    if args.check:
+        same = [check_one_sided()]
+        for filename in inputs:
+            same.append(check_reference(filename))
+            same.append(check(filename, args.workdir, args.analyses, args.reference, args.save_reference,
+                              args.check_step_size))
+        sys.exit(0 if all(same) else 1)
+    producer = None if args.producer is None else (args.producer_script, args.producer)
+    benchmark(inputs, args.stages, args.scale, args.workdir, args.step_size, args.results, producer)
+
+
+if __name__ == "__main__":
+    main()
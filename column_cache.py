@@ -0,0 +1,27 @@
+"""
+Writes the column cache (pi0tools/colcache.py) of miniTree files,
+"<file>.columns/" next to each: the outtree branches decoded once into
+uncompressed arrays that the analyses then read through memory mapping
+instead of decompressing the ROOT baskets on every run. A cache is ignored
+once its miniTree changes; rerun this to refresh it.
+
+    python column_cache.py miniTree.root miniTreeAM_modifEcal2.root
+"""
+import argparse
+
+from pi0tools import colcache, reader
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the column cache of miniTree files",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("inputs", nargs="+")
+    parser.add_argument("--tree", default=reader.TREE_NAME)
+    parser.add_argument("--step-size", type=int, default=reader.DEFAULT_STEP, help="events per chunk")
+    args = parser.parse_args()
+    for filename in args.inputs:
+        print("column cache written to", colcache.write(filename, args.tree, step_size=args.step_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Joint variation of the pi0 pairing and matching cuts of eratio.py and n_reco.py
+in a single pass over a miniTree: every combination of PI0_MASS, MASS_WINDOW,
+gen photon energy cut and Delta R cut gets its own set of histograms
+(ratio_1reco, ratio_2reco, ratio_1to1 of eratio.py and the nReco vs. gen Delta R
+hist2d of n_reco.py), written to one directory per grid point of a single file.
+
+The gen photons are paired by invariant mass as by the two scripts
+(pairs.mass_window_pairs; the energy cut 0 gives the n_reco.py pairs), for all
+the (mass, window, energy) settings at once. The Delta R cut only decides which of the nearest
+reco photons, computed once per photon, are matched, so adding cut values is
+almost free.
+
+    python cut_grid.py -i miniTree.root
+    python cut_grid.py -i miniTree.root --mass-window 0.03 0.05 --dr-cut 0.03 0.04 0.05
+"""
+import argparse
+import itertools
+import sys
+
+import ROOT
+import numpy as np
+from pi0tools import acceptance, driver, hists, kinematics, matching, pairs, reader
+
+input_file = "miniTree.root"
+output_file = "cut_grid.root"
+
+branches = reader.vector_branches("photon", "genPhoton") + ["genPi0E"]
+optional_branches = reader.vector_branches("photon", "genPhoton", components=reader.ANGLES)
+
+# Default grid, the nominal cuts of the scripts included
+PI0_MASSES = [0.135]  # GeV
+MASS_WINDOWS = [0.02, 0.03, 0.05, 0.08]  # GeV
+ENERGY_CUTS = [0.0, 0.1, 0.2, 0.3]  # GeV, gen photons
+DR_CUTS = [0.02, 0.03, 0.04, 0.05, 0.06]
+
+# (pi0 mass, mass window, energy cut) settings and the histograms of every grid point, made by book()
+pairings = []
+histograms = {}
+min_theta, max_theta = None, None
+
+
+def point_name(pi0_mass, mass_window, energy_cut, dr_cut):
+    return f"m{pi0_mass:g}_w{mass_window:g}_e{energy_cut:g}_dr{dr_cut:g}"
+
+
+def book(pi0_masses=PI0_MASSES, mass_windows=MASS_WINDOWS, energy_cuts=ENERGY_CUTS, dr_cuts=DR_CUTS):
+    pairings[:] = list(itertools.product(pi0_masses, mass_windows, energy_cuts))
+    histograms.clear()
+    for pairing, dr_cut in itertools.product(pairings, dr_cuts):
+        name = point_name(*pairing, dr_cut)
+        histograms[pairing, dr_cut] = {
+            "ratio_1reco": ROOT.TH1F("ratio_1reco", "Reco / Gen Energy Ratio;Reco Energy / Gen Pair Energy;Events", 50, 0, 1.5),
+            "ratio_2reco": ROOT.TH1F("ratio_2reco", "Reco / Gen Energy Ratio (2 reco photons);Reco Energy / Gen Pair Energy;Events", 50, 0, 1.5),
+            "ratio_1to1": ROOT.TH1F("ratio_1to1", "Reco / Gen Energy Ratio (1-to-1);Reco Energy / Gen Energy;Events", 50, 0, 2),
+            "hist2d": ROOT.TH2F("hist2d", f"nReco vs. #DeltaR between gen photon pairs ({name})", 50, 0, 0.03, 5, -0.5, 4.5),
+        }
+
+
+# Called before the first chunk
+def start(input_file):
+    global min_theta, max_theta
+    photon_acceptance = acceptance.read(input_file)
+    min_theta = photon_acceptance["thetaMin"]
+    max_theta = photon_acceptance["thetaMax"]
+    if not histograms:
+        book()
+
+
+def mass_window_pairs(batch, gen_pairs, gen_in_range):
+    """Accepted gen photon pairs of every pairing setting, as a boolean array (settings, pairs)."""
+    gen_e = batch["genPhotonE"].content
+    pi0_mass, mass_window, energy_cut = (np.array(values)[:, None] for values in zip(*pairings))
+    passed = gen_in_range[None, :] & (gen_e[None, :] >= energy_cut)
+    return pairs.mass_window_pairs(gen_pairs, pi0_mass, mass_window, passed, max_pairs=batch["genPi0E"].counts)
+
+
+# Called for each chunk of events
+def process(batch):
+    gen_theta = kinematics.column(batch, "genPhoton", "Theta").content
+    gen_in_range = (gen_theta >= min_theta) & (gen_theta <= max_theta)
+    gen_pairs = pairs.PairTable.from_batch(batch, "genPhoton")
+    accepted = mass_window_pairs(batch, gen_pairs, gen_in_range)
+
+    # The greedy pair matching for any cut: the first photon takes its nearest reco photon, the second its
+    # nearest one, or its second nearest if that is the one the first photon took.
+    best, best_dr, second, second_dr = matching.nearest_two(matching.DeltaRMatrix.from_batch(batch))
+    first_match, first_dr = best[gen_pairs.first], best_dr[gen_pairs.first]
+    taken = best[gen_pairs.second] == first_match
+    gen_e = batch["genPhotonE"].content
+    reco_e = batch["photonE"].content
+    pair_gen_e = np.column_stack((gen_e[gen_pairs.first], gen_e[gen_pairs.second]))
+
+    for (pairing, dr_cut), hist_set in histograms.items():
+        on = accepted[pairings.index(pairing)]
+        first_ok = first_dr[on] < dr_cut
+        use_second = first_ok & taken[on]
+        second_match = np.where(use_second, second[gen_pairs.second[on]], best[gen_pairs.second[on]])
+        second_ok = np.where(use_second, second_dr[gen_pairs.second[on]], best_dr[gen_pairs.second[on]]) < dr_cut
+
+        matched = np.column_stack((first_ok, second_ok))
+        match = np.column_stack((first_match[on], second_match))
+        pair_reco_e = np.zeros(match.shape)
+        pair_reco_e[matched] = reco_e[match[matched]]
+        gen_e_on = pair_gen_e[on]
+        ratio = pair_reco_e / gen_e_on.sum(axis=1, keepdims=True)
+        n_matched = matched.sum(axis=1, keepdims=True)
+        hists.fill(hist_set["ratio_1to1"], pair_reco_e[matched] / gen_e_on[matched])
+        hists.fill(hist_set["ratio_1reco"], ratio[matched & (n_matched == 1)])
+        hists.fill(hist_set["ratio_2reco"], ratio[matched & (n_matched == 2)])
+        hists.fill(hist_set["hist2d"], gen_pairs.dr[on], n_matched.ravel())
+
+
+# Called after the last chunk
+def finish():
+    out = ROOT.TFile(output_file, "RECREATE")
+    for (pairing, dr_cut), hist_set in histograms.items():
+        out.mkdir(point_name(*pairing, dr_cut)).cd()
+        for name, hist in hist_set.items():
+            hist.Write(name)
+    out.Close()
+    print(len(histograms), "grid points saved in", output_file)
+
+
+def main():
+    global input_file, output_file
+    parser = argparse.ArgumentParser(description="Pairing and matching cuts of eratio.py/n_reco.py varied jointly in one pass",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-i", "--input", default=input_file)
+    parser.add_argument("-o", "--output", default=output_file)
+    parser.add_argument("--pi0-mass", nargs="+", type=float, default=PI0_MASSES)
+    parser.add_argument("--mass-window", nargs="+", type=float, default=MASS_WINDOWS)
+    parser.add_argument("--energy-cut", nargs="+", type=float, default=ENERGY_CUTS)
+    parser.add_argument("--dr-cut", nargs="+", type=float, default=DR_CUTS)
+    args = parser.parse_args()
+
+    input_file, output_file = args.input, args.output
+    ROOT.TH1.AddDirectory(False)
+    book(args.pi0_mass, args.mass_window, args.energy_cut, args.dr_cut)
+    driver.run(input_file, [sys.modules[__name__]])
+
+
+if __name__ == "__main__":
+    main()
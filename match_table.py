@@ -0,0 +1,26 @@
+"""
+Writes the reco/gen match table (pi0tools/matchtable.py) of miniTree files,
+"<file>.matches.root" next to each. eratio.py, match_energy.py,
+match_energy_genpair.py and n_reco.py then take their matches from it instead
+of redoing the Delta R matching, whatever their cut or matching mode; a table
+is ignored once its miniTree changes.
+
+    python match_table.py miniTree.root miniTreeAM_modifEcal2.root
+"""
+import argparse
+
+from pi0tools import matchtable, reader
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the reco/gen match table of miniTree files",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("inputs", nargs="+")
+    parser.add_argument("--step-size", type=int, default=reader.DEFAULT_STEP, help="events per chunk")
+    args = parser.parse_args()
+    for filename in args.inputs:
+        print("match table written to", matchtable.write(filename, step_size=args.step_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import sys, os, math 
+import sys, os, math, json 
 from array import array
 import ROOT
 from ROOT import TFile, TTree, TH1F, TH2F
@@ -7,9 +7,11 @@ from podio import root_io
 import edm4hep
 from pathlib import Path
 import ctypes
+import multiprocessing
 
 from modules import tauReco
 from modules import myutils
+from pi0tools import edm, hists, instrument, kinematics
 
 import argparse
 parser = argparse.ArgumentParser(description="Configure the analysis",
@@ -19,44 +21,31 @@ parser = argparse.ArgumentParser(description="Configure the analysis",
 parser.add_argument("-f","--sample",default="ZTauTau_PolSM_March24_2M")
 parser.add_argument("-o","--outfile",default="miniTree")
 
-args = parser.parse_args()
-config = vars(args)
-print(config)
-
-fileOutName=args.outfile+".root"
-sample=args.sample
+# Configuration, which input files and how to split them
+parser.add_argument("--first",type=int,default=1,help="index of the first input file")
+parser.add_argument("-n","--nfiles",type=int,default=10,help="number of input files (the full sample has 2000)")
+parser.add_argument("--shard",type=int,default=0,help="only run on the files with (index-first)%%nshards==shard")
+parser.add_argument("--nshards",type=int,default=1,help="number of shards the file list is split in (e.g. one per batch job)")
+parser.add_argument("-j","--jobs",type=int,default=1,help="worker processes; each writes its own tree, merged at the end")
+parser.add_argument("--merge",nargs="+",default=None,help="only merge these producer outputs into OUTFILE.root")
+parser.add_argument("--keep-shards",action="store_true",help="keep the per-worker outputs after merging")
+parser.add_argument("--checkpoint",type=int,default=0,help="save the output every K input files (as parts merged at the end)")
+parser.add_argument("--resume",action="store_true",help="skip the input files already saved by an interrupted --checkpoint run")
+
+# Configuration, derived quantities (the taus are not needed for the diphoton study)
+parser.add_argument("--taus",choices=["all","gen","reco","none"],default="all",
+                    help="which taus to build for nGenTaus/nRecoTausHad (-1 when not built)")
+parser.add_argument("--angles",action="store_true",help="also write Theta, Phi and Eta of the photons and pi0s")
+
+# Monitoring: time per stage, objects per event and memory, also saved in OUTFILE.timing.json
+parser.add_argument("--report-every",type=int,default=10000,help="print the progress and stage timing every N events (0: never)")
 
 # get all the files
 #path="/nfs/cms/cepeda/FCC/fullsim/" 
 path="/pnfs/ciemat.es/data/cms/store/user/cepeda/FCC/FullSim/"
 file="out_reco_edm4hep_edm4hep"
-filenames=[]
-dir_path=path+"/"+sample
-names = ROOT.std.vector('string')()
-nfiles=len(os.listdir(dir_path))
-
-nfiles=10# 2000 
 badfiles=[-1] #11,15]
 
-print (dir_path)
-for i in range(1,nfiles+1):
-    if (i in badfiles): continue # this one is broken? why?
-#    filename=dir_path+"/{}".format(i)+"/"+file+".root"
-    filename=dir_path+"/"+file+"_{}.root".format(i)
-    print (filename)
-
-    my_file = Path(filename)
-    if my_file.is_file():
-        root_file = myutils.open_root_file(filename) 
-        # not critical, just paranoia since I had job failures 
-        if not root_file or root_file.IsZombie():
-            continue
-        #print (my_file)
-        filenames.append(filename)
-
-print ("Read %d files" %len(filenames))
-reader = root_io.Reader(filenames)
-
 # collections to use 
 genparts = "MCParticles"
 pfobjects="PandoraPFOs"
@@ -66,157 +55,328 @@ pfobjects="PandoraPFOs"
 treeName="outtree"
 variabsVec=["photon","genPhoton","genPi0"]
 vecComponents=["P","E","Px","Py","Pz","M"]
+angleComponents=["Theta","Phi","Eta"]
+# pi0 -> gamma gamma parentage: index of the parent in the genPi0 vectors and of
+# the (first two) daughters in the genPhoton vectors, -1 if none
+indexComponents={"genPhoton":["Pi0Index"],"genPi0":["Photon1Index","Photon2Index"]}
 variabs=["beamE","nPhotons","nGenPhotons","nGenPi0s","nGenTaus","nRecoTausHad"]
-outfile=ROOT.TFile(fileOutName,"RECREATE")
-new_tree = ROOT.TTree(treeName,"processed variables")
 
-branches = {}
 
-for var in variabs:
-        branches[var] = ctypes.c_double(0.0)  # Single double variable
-        new_tree.Branch(var, ctypes.addressof(branches[var]), f"{var}/D")
-
-for var in variabsVec:
-    for comp in vecComponents:
-        branches[var+comp] = ROOT.std.vector('double')()
+def findFiles(dir_path,fileIndices):
+    filenames=[]
+    print (dir_path)
+    for i in fileIndices:
+        if (i in badfiles): continue # this one is broken? why?
+    #    filename=dir_path+"/{}".format(i)+"/"+file+".root"
+        filename=dir_path+"/"+file+"_{}.root".format(i)
+        print (filename)
+
+        my_file = Path(filename)
+        if my_file.is_file():
+            root_file = myutils.open_root_file(filename) 
+            # not critical, just paranoia since I had job failures 
+            if not root_file or root_file.IsZombie():
+                continue
+            #print (my_file)
+            filenames.append(filename)
+    return filenames
+
+
+def processFiles(filenames,fileOutName,taus="all",angles=False,reportEvery=10000):
+    print ("Read %d files" %len(filenames))
+    stats=instrument.Instruments(reportEvery,os.path.basename(fileOutName))
+    doGenTaus=taus in ("all","gen")
+    doRecoTaus=taus in ("all","reco")
+
+    outfile=ROOT.TFile(fileOutName,"RECREATE")
+    new_tree = ROOT.TTree(treeName,"processed variables")
+
+    branches = {}
+
+    for var in variabs:
+            branches[var] = ctypes.c_double(0.0)  # Single double variable
+            new_tree.Branch(var, ctypes.addressof(branches[var]), f"{var}/D")
+
+    components=vecComponents+(angleComponents if angles else [])
+    vectorBranches=[(var,comp,'double') for var in variabsVec for comp in components]
+    vectorBranches+=[(var,comp,'int') for var in indexComponents for comp in indexComponents[var]]
+    for var,comp,vecType in vectorBranches:
+        branches[var+comp] = ROOT.std.vector(vecType)()
         new_tree.Branch(var+comp, branches[var+comp])
 
 
-# Accounting
-hEvents = TH1F("hEvents","hEvents",2,0,2)
-hPFMuonsE =TH1F("hPFMuonsE","",50,0,50)
-hPFElectronsE =TH1F("hPFElectronsE","",50,0,50)
-hPFPhotonsE =TH1F("hPFPhotonsE","",50,0,50)
-hGenPhotonsE =TH1F("hGenPhotonsE","",50,0,50)
-hGenPi0sE =TH1F("hGenPi0sE","",50,0,50)
-
-
-totalEvents=0
-selectedEvents=0
-
-# run over all events 
-for event in reader.get("events"):
-
-    if totalEvents%10000==0:
-       print (totalEvents)
-
-    # clean vector branches
-    for var in variabsVec:
-      for comp in vecComponents:
-         branches[var+comp].clear()
-
-    # get event info
-    totalEvents+=1
-    mc_particles = event.get( genparts )
-    beamE=mc_particles[0].getEnergy()
-    pfos = event.get(pfobjects)
-
-    ## get GEN level info
- 
-    # tau generator info (not needed, kept just in case)
-    genTaus=tauReco.findAllGenTaus(mc_particles)
-    nGenTaus=len(genTaus)
-    #gentau1_visP4=genTaus[0][0]
-    #gentau2_visP4=genTaus[1][0]
-    #gentau1_ID=genTaus[0][1]
-    #gentau2_ID=genTaus[1][1]
-    #gentau1_Q=genTaus[0][2]
-    #gentau2_Q=genTaus[1][2]
-    #gentau1_P4=genTaus[0][3]
-    #gentau2_P4=genTaus[1][3]
-
-    nGenPhotons=0
-    nGenPi0s=0
-
-    for mc in mc_particles:
-        if (abs(mc.getPDG())==22):
-          if mc.getEnergy()>0.1 and mc.getGeneratorStatus()==1:
-            photonP4=ROOT.TLorentzVector()
-            photonP4.SetXYZM(mc.getMomentum().x,mc.getMomentum().y,mc.getMomentum().z,mc.getMass())
-            hGenPhotonsE.Fill(mc.getEnergy())
-            branches["genPhotonE"].push_back(mc.getEnergy())
-            branches["genPhotonP"].push_back(photonP4.P())
-            branches["genPhotonPx"].push_back(mc.getMomentum().x)
-            branches["genPhotonPy"].push_back(mc.getMomentum().y)
-            branches["genPhotonPz"].push_back(mc.getMomentum().z)
-            branches["genPhotonM"].push_back(mc.getMass())
-
-            nGenPhotons+=1
-        if (abs(mc.getPDG())==111):
-            pi0P4=ROOT.TLorentzVector()
-            pi0P4.SetXYZM(mc.getMomentum().x,mc.getMomentum().y,mc.getMomentum().z,mc.getMass())
-            hGenPi0sE.Fill(mc.getEnergy())
-            branches["genPi0E"].push_back(mc.getEnergy())
-            branches["genPi0P"].push_back(pi0P4.P())
-            branches["genPi0Px"].push_back(mc.getMomentum().x)
-            branches["genPi0Py"].push_back(mc.getMomentum().y)
-            branches["genPi0Pz"].push_back(mc.getMomentum().z)
-            branches["genPi0M"].push_back(mc.getMass())
-            nGenPi0s+=1
-
-    ## get RECO level info
-
-    # build taus with DR=0.4, minP>0.1, neutron rejection (pandora bug) at 2 GeV)
-    # not needed for diphoton study!
-    unsorted_recoTaus= tauReco.findAllTaus(pfos,0.4, 0.1,2) 
-    recoTaus= myutils.sort_by_P(unsorted_recoTaus)
-    nRecoTausHad=len(recoTaus)
-
-    nPhotons=0
-    
-    for pf in pfos:
-        if (abs(pf.getPDG())==13):
-            muonP4=ROOT.TLorentzVector()
-            muonP4.SetXYZM(pf.getMomentum().x,pf.getMomentum().y,pf.getMomentum().z,pf.getMass())
-            hPFMuonsE.Fill(pf.getEnergy())
-        if (abs(pf.getPDG())==11):
-            electronP4=ROOT.TLorentzVector()
-            electronP4.SetXYZM(pf.getMomentum().x,pf.getMomentum().y,pf.getMomentum().z,pf.getMass())
-            hPFElectronsE.Fill(pf.getEnergy())
-        if (abs(pf.getPDG())==22):
-          if pf.getEnergy()>0.1:
-            photonP4=ROOT.TLorentzVector()
-            photonP4.SetXYZM(pf.getMomentum().x,pf.getMomentum().y,pf.getMomentum().z,pf.getMass())
-            hPFPhotonsE.Fill(pf.getEnergy())
-            branches["photonE"].push_back(pf.getEnergy())
-            branches["photonP"].push_back(photonP4.P())
-            branches["photonPx"].push_back(pf.getMomentum().x)
-            branches["photonPy"].push_back(pf.getMomentum().y)
-            branches["photonPz"].push_back(pf.getMomentum().z)
-            branches["photonM"].push_back(pf.getMomentum().z)
-            nPhotons+=1
-
-    # Some selection here?
-    # if... 
-
-    branches["nPhotons"].value=nPhotons
-    branches["nGenPhotons"].value=nGenPhotons
-    branches["nGenPi0s"].value=nGenPi0s
-    branches["nGenTaus"].value=nGenTaus
-    branches["nRecoTausHad"].value=nRecoTausHad
-    branches["beamE"].value=beamE
-
-
-    selectedEvents+=1
-    new_tree.Fill()
-
-hEvents.Fill(0,totalEvents)
-hEvents.Fill(1,selectedEvents)
-
-print ("Run over ",totalEvents," selected ",selectedEvents)#," ->",selectedEvents/totalEvents)
-print ("Writing file ",fileOutName)
-
-outfile.cd() # =ROOT.TFile(fileOutName,"RECREATE")
-
-hEvents.Write()
-hPFMuonsE.Write()
-hPFElectronsE.Write()
-hPFPhotonsE.Write()
-hGenPhotonsE.Write()
-hGenPi0sE.Write()
-
-new_tree.Write()
-
-outfile.Close()
-
-
+    # Accounting
+    hEvents = TH1F("hEvents","hEvents",2,0,2)
+    hPFMuonsE =TH1F("hPFMuonsE","",50,0,50)
+    hPFElectronsE =TH1F("hPFElectronsE","",50,0,50)
+    hPFPhotonsE =TH1F("hPFPhotonsE","",50,0,50)
+    hGenPhotonsE =TH1F("hGenPhotonsE","",50,0,50)
+    hGenPi0sE =TH1F("hGenPi0sE","",50,0,50)
+
+    # Acceptance summary, written to the "acceptance" directory of the output file
+    # so that the analyses do not need an extra pass over the tree to get it
+    recoThetaMin=math.inf
+    recoThetaMax=-math.inf
+    nPhotonsTotal=0
+    nGenPhotonsTotal=0
+    nGenPi0sTotal=0
+
+    totalEvents=0
+    selectedEvents=0
+
+    # the kinematics are read as arrays, a chunk of events at a time; the podio
+    # events are only opened for the tau reconstruction
+    if doGenTaus or doRecoTaus:
+        reader = root_io.Reader(filenames)
+        events=iter(reader.get("events"))
+    nGenTaus=-1
+    nRecoTausHad=-1
+    edmBranches=edm.branches(genparts,edm.MC_MEMBERS)+[edm.relation_branch(genparts,"parents")]
+    edmBranches+=edm.branches(pfobjects,edm.RECO_MEMBERS)
+
+    # the time since the previous lap goes to the stage named, reading the next chunk included
+    stats.mark()
+    for batch in edm.iterate(filenames,edmBranches):
+        stats.lap("read")
+
+        ## get GEN level info
+        mc=edm.four_vectors(batch,genparts)
+        mcPDG=np.abs(batch[genparts+".PDG"].content)
+        mcStatus=batch[genparts+".generatorStatus"].content
+        beamEs=mc["E"].content[mc["E"].starts]
+
+        genPhotonMask=(mcPDG==22) & (mc["E"].content>0.1) & (mcStatus==1)
+        genPi0Mask=mcPDG==111
+        genPhotons=edm.select(mc,genPhotonMask)
+        genPi0s=edm.select(mc,genPi0Mask)
+        hists.fill(hGenPhotonsE,genPhotons["E"].content)
+        hists.fill(hGenPi0sE,genPi0s["E"].content)
+
+        # follow the parent links of the gen photons to their pi0
+        parent=edm.first_parent(batch,genparts)[genPhotonMask]
+        pi0Index=edm.selected_index(mc["E"],genPi0Mask)
+        photonPi0=np.full(len(parent),-1,dtype=np.int32)
+        photonPi0[parent>=0]=pi0Index[parent[parent>=0]]
+        genPhotons["Pi0Index"]=genPhotons["E"].with_content(photonPi0)
+
+        fromPi0=np.flatnonzero(photonPi0>=0)
+        pi0Flat=genPi0s["E"].offsets[genPhotons["E"].event_index[fromPi0]]+photonPi0[fromPi0]
+        daughters=edm.first_two(pi0Flat,genPhotons["E"].local_index[fromPi0],len(genPi0s["E"].content))
+        genPi0s["Photon1Index"]=genPi0s["E"].with_content(daughters[0].astype(np.int32))
+        genPi0s["Photon2Index"]=genPi0s["E"].with_content(daughters[1].astype(np.int32))
+        stats.lap("gen")
+
+        ## get RECO level info
+        pf=edm.four_vectors(batch,pfobjects)
+        pfPDG=np.abs(batch[pfobjects+".PDG"].content)
+        hists.fill(hPFMuonsE,pf["E"].content[pfPDG==13])
+        hists.fill(hPFElectronsE,pf["E"].content[pfPDG==11])
+
+        photons=edm.select(pf,(pfPDG==22) & (pf["E"].content>0.1))
+        photons["M"]=photons["Pz"] # photonM has always been filled with Pz
+        hists.fill(hPFPhotonsE,photons["E"].content)
+        photonTheta=kinematics.theta(photons["Px"].content,photons["Py"].content,photons["Pz"].content)
+        if len(photonTheta):
+            recoThetaMin=min(recoThetaMin,photonTheta.min())
+            recoThetaMax=max(recoThetaMax,photonTheta.max())
+
+        stats.lap("reco")
+
+        nPhotonsTotal+=len(photons["E"].content)
+        nGenPhotonsTotal+=len(genPhotons["E"].content)
+        nGenPi0sTotal+=len(genPi0s["E"].content)
+        stats.count("mcParticles",len(mcPDG))
+        stats.count("pfos",len(pfPDG))
+        stats.count("genPhotons",len(genPhotons["E"].content))
+        stats.count("genPi0s",len(genPi0s["E"].content))
+        stats.count("photons",len(photons["E"].content))
+
+        collections={"photon":photons,"genPhoton":genPhotons,"genPi0":genPi0s}
+        if angles:
+            for columns in collections.values():
+                px,py,pz=(columns[comp].content for comp in ("Px","Py","Pz"))
+                columns["Theta"]=columns["Px"].with_content(kinematics.theta(px,py,pz))
+                columns["Phi"]=columns["Px"].with_content(kinematics.phi(px,py,pz))
+                columns["Eta"]=columns["Px"].with_content(kinematics.eta(px,py,pz))
+            stats.lap("angles")
+        counts={"nPhotons":photons["E"].counts,"nGenPhotons":genPhotons["E"].counts,"nGenPi0s":genPi0s["E"].counts}
+
+        for i in range(len(batch)):
+
+            totalEvents+=1
+            if doGenTaus or doRecoTaus:
+                event=next(events)
+                stats.lap("podio")
+
+            # tau generator info (not needed, kept just in case)
+            if doGenTaus:
+                genTaus=tauReco.findAllGenTaus(event.get(genparts))
+                nGenTaus=len(genTaus)
+                stats.lap("genTaus")
+                stats.count("genTaus",nGenTaus)
+
+            # build taus with DR=0.4, minP>0.1, neutron rejection (pandora bug) at 2 GeV)
+            # not needed for diphoton study!
+            if doRecoTaus:
+                unsorted_recoTaus= tauReco.findAllTaus(event.get(pfobjects),0.4, 0.1,2) 
+                recoTaus= myutils.sort_by_P(unsorted_recoTaus)
+                nRecoTausHad=len(recoTaus)
+                stats.lap("recoTaus")
+                stats.count("recoTausHad",nRecoTausHad)
+
+            for var,comp,vecType in vectorBranches:
+                branches[var+comp].assign(collections[var][comp][i])
+
+            # Some selection here?
+            # if... 
+
+            for var in counts:
+                branches[var].value=counts[var][i]
+            branches["nGenTaus"].value=nGenTaus
+            branches["nRecoTausHad"].value=nRecoTausHad
+            branches["beamE"].value=beamEs[i]
+            stats.lap("branches")
+
+            selectedEvents+=1
+            new_tree.Fill()
+            stats.lap("fill")
+            stats.add_events()
+
+    hEvents.Fill(0,totalEvents)
+    hEvents.Fill(1,selectedEvents)
+
+    print ("Run over ",totalEvents," selected ",selectedEvents)#," ->",selectedEvents/totalEvents)
+    print ("Writing file ",fileOutName)
+
+    stats.mark()
+    outfile.cd() # =ROOT.TFile(fileOutName,"RECREATE")
+
+    hEvents.Write()
+    hPFMuonsE.Write()
+    hPFElectronsE.Write()
+    hPFPhotonsE.Write()
+    hGenPhotonsE.Write()
+    hGenPi0sE.Write()
+
+    new_tree.Write()
+
+    # merge modes: m = keep the minimum, M = the maximum, + = the sum (used by hadd)
+    acceptanceDir=outfile.mkdir("acceptance")
+    acceptanceDir.cd()
+    acceptance=[("thetaMin",recoThetaMin,"m"),("thetaMax",recoThetaMax,"M"),
+                ("nEvents",selectedEvents,"+"),("nPhotons",nPhotonsTotal,"+"),
+                ("nGenPhotons",nGenPhotonsTotal,"+"),("nGenPi0s",nGenPi0sTotal,"+")]
+    for name,value,mergeMode in acceptance:
+        ROOT.TParameter("double")(name,value,mergeMode).Write()
+
+    outfile.Close()
+    stats.lap("write")
+    return stats.summary()
+
+
+def processCheckpointed(filenames,fileOutName,everyFiles,resume=False,taus="all",angles=False,reportEvery=10000):
+    # every block of files goes to its own part file, and the blocks already
+    # done are listed in <outfile>.checkpoint.json, so that a crash only loses
+    # the block being processed
+    stateName=fileOutName.replace(".root",".checkpoint.json")
+    committed={}
+    if resume and os.path.exists(stateName):
+        with open(stateName) as state:
+            committed=json.load(state)
+
+    stats=instrument.Instruments(0,os.path.basename(fileOutName))
+    partNames=[]
+    for k in range(0,len(filenames),everyFiles):
+        block=filenames[k:k+everyFiles]
+        partName=fileOutName.replace(".root","_part{}.root".format(k//everyFiles))
+        partNames.append(partName)
+        if committed.get(partName)==block and os.path.exists(partName):
+            print ("Skipping ",len(block)," files already in ",partName)
+            continue
+        stats.add(processFiles(block,partName+".tmp",taus,angles,reportEvery))
+        os.replace(partName+".tmp",partName)
+        committed[partName]=block
+        with open(stateName+".tmp","w") as state:
+            json.dump(committed,state,indent=1)
+        os.replace(stateName+".tmp",stateName)
+
+    stats.mark()
+    mergeFiles(partNames,fileOutName)
+    stats.lap("merge")
+    for name in partNames+[stateName]:
+        os.remove(name)
+    return stats.summary()
+
+
+def runFiles(filenames,fileOutName,args):
+    # returns the timing summary of the run
+    if args.checkpoint>0:
+        return processCheckpointed(filenames,fileOutName,args.checkpoint,args.resume,args.taus,args.angles,args.report_every)
+    return processFiles(filenames,fileOutName,args.taus,args.angles,args.report_every)
+
+
+def processShard(shard):
+    filenames,fileOutName,args=shard
+    return fileOutName,runFiles(filenames,fileOutName,args)
+
+
+def mergeFiles(inputNames,fileOutName):
+    # the tree is concatenated, the histograms added and the acceptance
+    # parameters combined with their own merge mode (min, max or sum)
+    print ("Merging ",len(inputNames)," files into ",fileOutName)
+    merger=ROOT.TFileMerger(False)
+    merger.OutputFile(fileOutName,"RECREATE")
+    for name in inputNames:
+        merger.AddFile(name)
+    if not merger.Merge():
+        raise RuntimeError("could not merge into "+fileOutName)
+
+
+if __name__=="__main__":
+    args = parser.parse_args()
+    config = vars(args)
+    print(config)
+
+    fileOutName=args.outfile+".root"
+    sample=args.sample
+
+    if args.merge:
+        mergeFiles(args.merge,fileOutName)
+        sys.exit(0)
+
+    dir_path=path+"/"+sample
+    fileIndices=[i for i in range(args.first,args.first+args.nfiles) if (i-args.first)%args.nshards==args.shard]
+    if args.nshards>1:
+        fileOutName=args.outfile+"_{}.root".format(args.shard)
+    filenames=findFiles(dir_path,fileIndices)
+
+    # the summaries of the workers (or parts) are added up in the one of the whole run
+    stats=instrument.Instruments(0,os.path.basename(fileOutName))
+    timingName=fileOutName.replace(".root",".timing.json")
+    if args.jobs<=1 or len(filenames)<=1:
+        stats.add(runFiles(filenames,fileOutName,args))
+        stats.report()
+        stats.write(timingName)
+        print ("Timing summary written to ",timingName)
+        sys.exit(0)
+
+    # contiguous blocks of files, so that the merged tree keeps the file order
+    nJobs=min(args.jobs,len(filenames))
+    blocks=np.array_split(np.arange(len(filenames)),nJobs)
+    shards=[([filenames[i] for i in block],fileOutName.replace(".root","_shard{}.root".format(k)),args)
+            for k,block in enumerate(blocks)]
+    with multiprocessing.get_context("spawn").Pool(nJobs) as pool:
+        results=pool.map(processShard,shards,chunksize=1)
+    shardNames=[name for name,summary in results]
+    for name,summary in results:
+        stats.add(summary)
+
+    stats.mark()
+    mergeFiles(shardNames,fileOutName)
+    stats.lap("merge")
+    if not args.keep_shards:
+        for name in shardNames:
+            os.remove(name)
+    stats.report()
+    stats.write(timingName)
+    print ("Timing summary written to ",timingName)
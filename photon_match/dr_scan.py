@@ -0,0 +1,123 @@
+"""
+This script scans the delta R cut used to match reco photons to gen photons.
+For a grid of thresholds it computes, in a single pass over the file:
+- efficiency: fraction of gen photons (inside the reco theta range) with a reco photon closer than the threshold
+- purity: fraction of the reco photons matched at that threshold whose gen photon has them as its closest reco photon
+- fake rate: fraction of reco photons with no gen photon closer than the threshold
+Only the closest-partner delta R of each photon is histogrammed, the curves are cumulative sums,
+so scanning 100 thresholds costs the same as one.
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import ROOT
+import numpy as np
+from pi0tools import acceptance, driver, kinematics, matching, reader
+
+input_file = "miniTree.root"
+
+# Reco and gen photon branches, read in chunks of events
+branches = reader.vector_branches("photon", "genPhoton")
+# Theta/Phi/Eta are read from the file when it has them instead of being recomputed
+optional_branches = reader.vector_branches("photon", "genPhoton", components=reader.ANGLES)
+
+# Thresholds scanned: upper edges of the bins of the curves
+N_THRESHOLDS, DR_MAX = 100, 0.2
+thresholds = np.linspace(DR_MAX / N_THRESHOLDS, DR_MAX, N_THRESHOLDS)
+CURRENT_CUT = matching.DR_CUT
+
+# Photon counts by closest-partner delta R: entry k counts thresholds[k-1] <= delta R < thresholds[k]
+# (the last one delta R >= DR_MAX or no partner)
+gen_counts = np.zeros(N_THRESHOLDS + 1, dtype=np.int64)
+reco_counts = np.zeros(N_THRESHOLDS + 1, dtype=np.int64)
+reco_mutual_counts = np.zeros(N_THRESHOLDS + 1, dtype=np.int64)
+accumulators = {"gen_counts": "sum", "reco_counts": "sum", "reco_mutual_counts": "sum"}  # run_dataset.py
+
+# Curves, filled by finish()
+hist_efficiency = ROOT.TH1D("dr_scan_efficiency", "Matching efficiency;#DeltaR cut;Efficiency", N_THRESHOLDS, 0, DR_MAX)
+hist_purity = ROOT.TH1D("dr_scan_purity", "Matching purity;#DeltaR cut;Purity", N_THRESHOLDS, 0, DR_MAX)
+hist_fake_rate = ROOT.TH1D("dr_scan_fake_rate", "Fake rate;#DeltaR cut;Fake rate", N_THRESHOLDS, 0, DR_MAX)
+# Theta range of the reco photons, from the acceptance summary of the input file
+min_theta, max_theta = None, None
+
+
+def count_below(counts, dr):
+    # histogram delta R on the threshold grid (inf: no partner)
+    counts += np.bincount(np.searchsorted(thresholds, dr, side="right"), minlength=N_THRESHOLDS + 1)
+
+
+# Called before the first chunk
+def start(input_file):
+    global min_theta, max_theta
+    photon_acceptance = acceptance.read(input_file)
+    min_theta = photon_acceptance["thetaMin"]
+    max_theta = photon_acceptance["thetaMax"]
+
+
+# Called for each chunk of events
+def process(batch):
+    gen_theta = kinematics.column(batch, "genPhoton", "Theta").content
+    gen_in_range = (gen_theta >= min_theta) & (gen_theta <= max_theta)
+
+    # Closest reco photon of every gen photon, and closest gen photon of every reco photon
+    gen_best, gen_dr = matching.nearest(matching.DeltaRMatrix.from_batch(batch))
+    reco_best, reco_dr = matching.nearest(matching.DeltaRMatrix.from_batch(batch, targets="photon", candidates="genPhoton"))
+    has_gen = reco_best >= 0
+    mutual = np.zeros(len(reco_best), dtype=bool)
+    mutual[has_gen] = gen_best[reco_best[has_gen]] == np.flatnonzero(has_gen)
+
+    count_below(gen_counts, gen_dr[gen_in_range])
+    count_below(reco_counts, reco_dr)
+    count_below(reco_mutual_counts, reco_dr[mutual])
+
+
+# Called after the last chunk
+def finish():
+    # Photons closer than each threshold
+    gen_matched = np.cumsum(gen_counts)[:-1]
+    reco_matched = np.cumsum(reco_counts)[:-1]
+    reco_mutual = np.cumsum(reco_mutual_counts)[:-1]
+    n_gen, n_reco = gen_counts.sum(), reco_counts.sum()
+
+    efficiency = gen_matched / max(n_gen, 1)
+    purity = np.divide(reco_mutual, reco_matched, out=np.zeros(N_THRESHOLDS), where=reco_matched > 0)
+    fake_rate = 1 - reco_matched / max(n_reco, 1)
+    for k in range(N_THRESHOLDS):
+        hist_efficiency.SetBinContent(k + 1, efficiency[k])
+        hist_purity.SetBinContent(k + 1, purity[k])
+        hist_fake_rate.SetBinContent(k + 1, fake_rate[k])
+
+    out = ROOT.TFile("dr_scan_results.root", "RECREATE")
+    hist_efficiency.Write()
+    hist_purity.Write()
+    hist_fake_rate.Write()
+    out.Close()
+
+    k = np.searchsorted(thresholds, CURRENT_CUT)
+    print(f"Delta R < {thresholds[k]:.3f}: efficiency = {efficiency[k]:.4f}, purity = {purity[k]:.4f}, fake rate = {fake_rate[k]:.4f}")
+    print("results saved")
+
+
+# Draws and saves the plots (also later, from saved histograms: plot_results.py)
+def plot():
+    canvas = ROOT.TCanvas("c_dr_scan", "Delta R cut scan", 800, 600)
+    canvas.DrawFrame(0, 0, DR_MAX, 1.05, "Delta R cut scan;#DeltaR cut;Fraction")
+    for hist, color in ((hist_efficiency, ROOT.kBlue), (hist_purity, ROOT.kGreen + 2), (hist_fake_rate, ROOT.kRed)):
+        hist.SetStats(0)
+        hist.SetLineColor(color)
+        hist.SetLineWidth(2)
+        hist.Draw("HIST SAME")
+    line = ROOT.TLine(CURRENT_CUT, 0, CURRENT_CUT, 1.05)
+    line.SetLineStyle(2)
+    line.Draw()
+    legend = ROOT.TLegend(0.6, 0.4, 0.88, 0.6)
+    legend.AddEntry(hist_efficiency, "Efficiency", "l")
+    legend.AddEntry(hist_purity, "Purity", "l")
+    legend.AddEntry(hist_fake_rate, "Fake rate", "l")
+    legend.Draw()
+    canvas.SaveAs("dR_threshold_scan.png")
+
+
+if __name__ == "__main__":
+    driver.run(input_file, [sys.modules[__name__]])
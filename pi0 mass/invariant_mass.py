@@ -7,34 +7,30 @@ It classifies events into four categories:
 - Class C: 2 pi0 mesons
 - Class D: More than 2 pi0 mesons
 and generates histograms for each class.
+Merged photon candidates (a gen pi0 reconstructed as a single photon) are saved in merged_photon_candidates.root.
 """
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
 import ROOT
 import numpy as np
-from itertools import combinations
+import uproot
+from pi0tools import driver, hists, matching, pairs, reader
 
-file = ROOT.TFile("miniTree.root")
-tree = file.Get("outtree")
+input_file = "miniTree.root"
 ROOT.gStyle.SetOptStat("eMRuo")
 
-# Set up reconstructed photon branches.
-pho_e = ROOT.std.vector('double')()
-pho_px = ROOT.std.vector('double')()
-pho_py = ROOT.std.vector('double')()
-pho_pz = ROOT.std.vector('double')()
-genpho_e = ROOT.std.vector('double')()
-genpho_px = ROOT.std.vector('double')()
-genpho_py = ROOT.std.vector('double')()
-genpho_pz = ROOT.std.vector('double')()
-genpi0_e = ROOT.std.vector('double')()
-genpi0_px = ROOT.std.vector('double')()
-genpi0_py = ROOT.std.vector('double')()
-genpi0_pz = ROOT.std.vector('double')()
+# Reconstructed photon, gen photon and gen pi0 branches, read in chunks of events.
+branches = reader.vector_branches("photon", "genPhoton", "genPi0")
 
 
 n_class_A, n_class_B, n_class_C, n_class_D = 0, 0, 0, 0
 
 # Classify eveents by the number of genpi0.
 M_LOW, M_HIGH, N_BINS = 0.0, 300.0, 150
+PI0_MASS = 135  # MeV
+PI0_MASS_SIGMA = 10  # MeV, for the chi2 of the multi-pi0 pairing
 hist_by_class = {
     "A": ROOT.TH1F("invMass_classA", "Mass (Class A, 0 pi0); Mass (MeV); Events", N_BINS, M_LOW, M_HIGH),
     "B": ROOT.TH1F("invMass_classB", "Mass (Class B, 1 pi0); Mass (MeV); Events", N_BINS, M_LOW, M_HIGH),
@@ -42,174 +38,180 @@ hist_by_class = {
     "D": ROOT.TH1F("invMass_classD", "Mass (Class D, >2 pi0); Mass (MeV); Events", N_BINS, M_LOW, M_HIGH),
 }
 
+# Class C/D: all the pairs of the best disjoint set, as many pairs as gen pi0s.
+hist_multi_by_class = {
+    "C": ROOT.TH1F("invMassMulti_classC", "Best disjoint pairs (Class C, 2 pi0); Mass (MeV); Pairs", N_BINS, M_LOW, M_HIGH),
+    "D": ROOT.TH1F("invMassMulti_classD", "Best disjoint pairs (Class D, >2 pi0); Mass (MeV); Pairs", N_BINS, M_LOW, M_HIGH),
+}
+
 
 hist_pi0count_vs_nreco = ROOT.TH2F("pi0count_vs_nreco", "gen pi0 count vs Reco photons; gen pi0s; Reco photons", 5, 0, 5, 10, 0, 10)
 hist_nreco_vs_minDR = ROOT.TH2F("nreco_vs_minDR", "Reco photon count vs Min ΔR; Reco photons; Min ΔR", 10, 0, 10, 50, 0.0, 0.2)
 hist_genDeltaR = ROOT.TH1F("genPhotonPairDeltaR", "ΔR between gen photon pairs; ΔR; Events", 100, 0, 0.1)
 hist_genPhoDeltaR = ROOT.TH1F("genPhoDeltaR", "ΔR between gen photons from pi0 (M ≈ 135 MeV); ΔR; Events", 100, 0, 0.1)
 
-tree.SetBranchAddress("photonE", pho_e)
-tree.SetBranchAddress("photonPx", pho_px)
-tree.SetBranchAddress("photonPy", pho_py)
-tree.SetBranchAddress("photonPz", pho_pz)
-tree.SetBranchAddress("genPhotonE", genpho_e)
-tree.SetBranchAddress("genPhotonPx", genpho_px)
-tree.SetBranchAddress("genPhotonPy", genpho_py)
-tree.SetBranchAddress("genPhotonPz", genpho_pz)
-tree.SetBranchAddress("genPi0E", genpi0_e)
-tree.SetBranchAddress("genPi0Px", genpi0_px)
-tree.SetBranchAddress("genPi0Py", genpi0_py)
-tree.SetBranchAddress("genPi0Pz", genpi0_pz)
-
 hist_all = ROOT.TH1F("invMassHist_all", "pi0 Mass (all); Mass (MeV); Events", N_BINS, M_LOW, M_HIGH)
 hist_2d = ROOT.TH2F("massDR", "Mass vs DR; Mass (MeV); DR", N_BINS, M_LOW, M_HIGH, 50, 0.0, 0.2)
 hist_minDR = ROOT.TH2F("minDR", "Min DR vs Mass; Mass (MeV); Min DR", N_BINS, M_LOW, M_HIGH, 50, 0.0, 0.06)
 
 
-cell_size = 0.005  # 5 mm
-R_in = 2.15  # m
-R_outer = 2.35  # m
-# Given that the PF algorithm identify clusters, the cell size in min delta R calulation should be multiplied by 3.
-min_deltaR_in= np.sqrt((cell_size * 3/R_in)**2 + (0.5*cell_size * 3/R_in)**2)  # Minimum ΔR based on ECAL geometry.
-min_deltaR_outer = np.sqrt((cell_size * 3/R_outer)**2 + (0.5*cell_size * 3/R_outer)**2)
-
-n_skipped, n_all, n_cut = 0, 0, 0
+n_skipped, n_all = 0, 0
 n_genpi0 = 0
-
-for evt_idx, evt in enumerate(tree):
-    n = pho_e.size()
-    n_pi0 = genpi0_e.size()
-    n_genpi0 += n_pi0
+merged_candidates = []  # per chunk, written by finish()
+MERGED_FILE = "merged_photon_candidates.root"
+# columns of its candidates tree
+MERGED_COLUMNS = {"event": np.int64, "recoE": np.float64, "genPi0E": np.float64, "deltaR": np.float64,
+                  "pairMass": np.float64, "photon": np.int64, "genPi0": np.int64, "pairPhoton1": np.int64,
+                  "pairPhoton2": np.int64}
+# merge rules over the files of a dataset (run_dataset.py); the candidate events are numbered across the files
+accumulators = {"n_class_A": "sum", "n_class_B": "sum", "n_class_C": "sum", "n_class_D": "sum",
+                "n_skipped": "sum", "n_all": "sum", "n_genpi0": "sum", "merged_candidates": "events"}
+
+
+# Called for each chunk of events
+def process(batch):
+    global n_class_A, n_class_B, n_class_C, n_class_D, n_skipped, n_all, n_genpi0
+    n_reco = batch["photonE"].counts
+    n_gen = batch["genPhotonE"].counts
+    n_pi0 = batch["genPi0E"].counts
+    n_genpi0 += n_pi0.sum()
 
     #  Fill reco-vs-truth count histogram.
-    hist_pi0count_vs_nreco.Fill(n_pi0, n)
+    hists.fill(hist_pi0count_vs_nreco, n_pi0, n_reco)
 
     # Event classification
-    if n_pi0 == 0:
-        n_class_A += 1
-        class_key = "A"
-    elif n_pi0 == 1:
-        n_class_B += 1
-        class_key = "B"
-    elif n_pi0 == 2:
-        n_class_C += 1
-        class_key = "C"
-    else:
-        n_class_D += 1
-        class_key = "D"
-
-    if n < 2:
-        n_skipped += 1
-        continue
-
-    photons = []
-    for j in range(n):
-        p4 = ROOT.TLorentzVector()
-        p4.SetPxPyPzE(pho_px[j]*1e3, pho_py[j]*1e3, pho_pz[j]*1e3, pho_e[j]*1e3)
-        photons.append(p4)
-
-    inv_m = float('inf')
-    DR = 0.
-    p_T = 0.
-    for a, b in combinations(photons, 2):
-        m = (a + b).M()
-        dr = a.DeltaR(b)
-        pt = (a + b).Pt()
-        sig = abs(m - 135)
-        if sig < inv_m:
-            inv_m = m
-            DR = dr
-            p_T = pt
-
-    hist_by_class[class_key].Fill(inv_m)
-
-    min_dr = float('inf')
-    if genpho_e.size() > 0 and len(photons) > 0:
-        for i in range(genpho_e.size()):
-            gen_p4 = ROOT.TLorentzVector()
-            gen_p4.SetPxPyPzE(genpho_px[i]*1e3, genpho_py[i]*1e3, genpho_pz[i]*1e3, genpho_e[i]*1e3)
-            for reco in photons:
-                dr = reco.DeltaR(gen_p4)
-                if dr < min_dr:
-                    min_dr = dr
-        hist_minDR.Fill(inv_m, min_dr)
-        hist_nreco_vs_minDR.Fill(n, min_dr)
-
-        for j, k in combinations(range(genpho_e.size()), 2):
-            g1 = ROOT.TLorentzVector()
-            g2 = ROOT.TLorentzVector()
-            g1.SetPxPyPzE(genpho_px[j]*1e3, genpho_py[j]*1e3, genpho_pz[j]*1e3, genpho_e[j]*1e3)
-            g2.SetPxPyPzE(genpho_px[k]*1e3, genpho_py[k]*1e3, genpho_pz[k]*1e3, genpho_e[k]*1e3)
-            hist_genDeltaR.Fill(g1.DeltaR(g2))
-
-            if class_key in ["B", "C", "D"]:
-                pi0_candidate = g1 + g2
-                if abs(pi0_candidate.M() - 135) < 10:
-                    deltaR_gen = g1.DeltaR(g2)
-                    hist_genPhoDeltaR.Fill(deltaR_gen)
-
-    # Identify merged photons (lines 97-115)
-    # For each gen pi0, check if a single reco photon matches its momentum (ΔR and energy) and if there is a photon pair with mass near 135 MeV
-    merged_photon_found = False
-    for g in range(genpi0_e.size()):
-        genpi0_p4 = ROOT.TLorentzVector()
-        genpi0_p4.SetPxPyPzE(genpi0_px[g]*1e3, genpi0_py[g]*1e3, genpi0_pz[g]*1e3, genpi0_e[g]*1e3)
-
-        for reco in photons:
-            energy_diff = abs(reco.E() - genpi0_p4.E())
-            delta_r = reco.DeltaR(genpi0_p4)
-            if energy_diff < 20 and delta_r < 0.05:  # 20 MeV energy window, 0.05 deltaR window.
-                for a, b in combinations(photons, 2):
-                    m = (a + b).M()
-                    if abs(m - 135) < 10:
-                        merged_photon_found = True
-                        print(f"Event {evt_idx}: Merged photon candidate found. Reco E={reco.E():.1f} MeV, Gen pi0 E={genpi0_p4.E():.1f} MeV, ΔR={delta_r:.3f}, Pair mass={m:.1f} MeV")
-                        break
-            if merged_photon_found:
-                break
-        if merged_photon_found:
-            break
-
-    hist_2d.Fill(inv_m, DR)
-    hist_all.Fill(inv_m)
-    n_all += 1
-
-out = ROOT.TFile("massDR_results.root", "RECREATE")
-hist_all.Write()
-hist_2d.Write()
-hist_minDR.Write()
-hist_pi0count_vs_nreco.Write()
-hist_nreco_vs_minDR.Write()
-hist_genDeltaR.Write()
-hist_genPhoDeltaR.Write()
-for hist in hist_by_class.values():
-    hist.Write()
-out.Close()
-
-
-c_pi0_vs_reco = ROOT.TCanvas("c_pi0_vs_reco", "gen π⁰ count vs Reco photons", 800, 600)
-hist_pi0count_vs_nreco.Draw("COLZ")
-c_pi0_vs_reco.SaveAs("pi0_vs_reco_photons.png")
-
-c_nreco_vs_minDR = ROOT.TCanvas("c_nreco_vs_minDR", "Reco Count vs Min DR", 800, 600)
-hist_nreco_vs_minDR.Draw("COLZ")
-c_nreco_vs_minDR.SaveAs("nreco_vs_minDR.png")
-
-c_genDR = ROOT.TCanvas("c_genDR", "ΔR Between Gen Photon Pairs", 800, 600)
-hist_genDeltaR.Draw()
-c_genDR.SaveAs("genPhotonPairDeltaR.png")
-
-c_genPhoDR = ROOT.TCanvas("c_genPhoDR", "ΔR Between Gen Photons from π⁰", 800, 600)
-hist_genPhoDeltaR.SetLineColor(ROOT.kRed+1)
-hist_genPhoDeltaR.Draw()
-c_genPhoDR.SaveAs("genPhoDeltaR_pi0.png")
-
-for key, hist in hist_by_class.items():
-    c = ROOT.TCanvas(f"c_class_{key}", f"Mass Distribution: Class {key}", 800, 600)
-    hist.SetLineWidth(2)
-    hist.SetLineColor(ROOT.kAzure + ord(key))
-    hist.Draw()
-    c.SaveAs(f"mass_by_class_{key}.png")
-
-file.Close()
-print("results saved")
\ No newline at end of file
+    class_keys = np.array(["A", "B", "C", "D"])[np.minimum(n_pi0, 3)]
+    n_class_A += np.count_nonzero(n_pi0 == 0)
+    n_class_B += np.count_nonzero(n_pi0 == 1)
+    n_class_C += np.count_nonzero(n_pi0 == 2)
+    n_class_D += np.count_nonzero(n_pi0 > 2)
+
+    selected = n_reco >= 2
+    n_skipped += np.count_nonzero(~selected)
+    n_all += np.count_nonzero(selected)
+
+    # Reco photon pair closest to the pi0 mass in every event.
+    reco_pairs = pairs.PairTable.from_batch(batch, "photon", scale=1e3)
+    best = reco_pairs.closest(PI0_MASS)[selected]
+    inv_m = reco_pairs.mass[best]
+    DR = reco_pairs.dr[best]
+    for key, hist in hist_by_class.items():
+        hists.fill(hist, inv_m[class_keys[selected] == key])
+
+    # Best disjoint set of pairs (smallest total mass chi2) in the events with several pi0s.
+    candidates = pairs.best_disjoint(reco_pairs, PI0_MASS, PI0_MASS_SIGMA, max_pairs=np.where(n_pi0 >= 2, n_pi0, 0))
+    candidate_class = class_keys[reco_pairs.event[candidates.content]]
+    for key, hist in hist_multi_by_class.items():
+        hists.fill(hist, reco_pairs.mass[candidates.content[candidate_class == key]])
+
+    # Closest reco/gen photon pair of every event with gen photons.
+    matrix = matching.DeltaRMatrix.from_batch(batch)
+    min_dr = np.full(len(batch), np.inf)
+    np.minimum.at(min_dr, matrix.target_event[matrix.target], matrix.dr)
+    has_gen = (n_gen > 0)[selected]
+    hists.fill(hist_minDR, inv_m[has_gen], min_dr[selected][has_gen])
+    hists.fill(hist_nreco_vs_minDR, n_reco[selected][has_gen], min_dr[selected][has_gen])
+
+    # Gen photon pairs, in the events kept above.
+    gen_pairs = pairs.PairTable.from_batch(batch, "genPhoton", scale=1e3)
+    gen_kept = selected[gen_pairs.event]
+    hists.fill(hist_genDeltaR, gen_pairs.dr[gen_kept])
+    from_pi0 = gen_kept & (n_pi0[gen_pairs.event] > 0) & (np.abs(gen_pairs.mass - PI0_MASS) < 10)
+    hists.fill(hist_genPhoDeltaR, gen_pairs.dr[from_pi0])
+
+    hists.fill(hist_2d, inv_m, DR)
+    hists.fill(hist_all, inv_m)
+
+    # Identify merged photons
+    # A gen pi0 with a single reco photon matching its momentum (ΔR and energy), in an event with a photon pair
+    # within 10 MeV of the pi0 mass: the first such (pi0, photon) and the first such pair of the event are kept.
+    in_window = np.abs(reco_pairs.mass - PI0_MASS) < 10
+    pair = first_in_event(in_window, reco_pairs.event, len(batch))
+    pi0_matrix = matching.DeltaRMatrix.from_batch(batch, targets="genPi0", candidates="photon")
+    pi0_e = batch["genPi0E"].content[pi0_matrix.target] * 1e3
+    reco_e = batch["photonE"].content[pi0_matrix.cand] * 1e3
+    close = (np.abs(reco_e - pi0_e) < 20) & (pi0_matrix.dr < 0.05)  # 20 MeV energy window, 0.05 deltaR window.
+    entry = first_in_event(close, pi0_matrix.target_event[pi0_matrix.target], len(batch))
+    events = np.flatnonzero((pair >= 0) & (entry >= 0))
+    entry, pair = entry[events], pair[events]
+    merged_candidates.append({
+        "event": batch.entry_start + events,
+        "recoE": reco_e[entry],
+        "genPi0E": pi0_e[entry],
+        "deltaR": pi0_matrix.dr[entry],
+        "pairMass": reco_pairs.mass[pair],
+        "photon": pi0_matrix.cand[entry] - batch["photonE"].offsets[events],
+        "genPi0": pi0_matrix.target[entry] - batch["genPi0E"].offsets[events],
+        "pairPhoton1": reco_pairs.first[pair] - batch["photonE"].offsets[events],
+        "pairPhoton2": reco_pairs.second[pair] - batch["photonE"].offsets[events],
+    })
+
+
+def first_in_event(mask, event, n_events):
+    # first index where mask is True in each event, -1 if none
+    first = np.full(n_events, len(mask), dtype=np.int64)
+    np.minimum.at(first, event[mask], np.flatnonzero(mask))
+    return np.where(first == len(mask), -1, first)
+
+
+# Called after the last chunk
+def finish():
+    out = ROOT.TFile("massDR_results.root", "RECREATE")
+    hist_all.Write()
+    hist_2d.Write()
+    hist_minDR.Write()
+    hist_pi0count_vs_nreco.Write()
+    hist_nreco_vs_minDR.Write()
+    hist_genDeltaR.Write()
+    hist_genPhoDeltaR.Write()
+    for hist in hist_by_class.values():
+        hist.Write()
+    for hist in hist_multi_by_class.values():
+        hist.Write()
+    out.Close()
+
+    # Merged photon candidates, one entry per event (the tree is written empty when no chunk was processed)
+    candidates = {name: np.concatenate([np.empty(0, dtype)] + [chunk[name] for chunk in merged_candidates]).astype(dtype)
+                  for name, dtype in MERGED_COLUMNS.items()}
+    with uproot.recreate(MERGED_FILE) as merged_out:
+        merged_out["candidates"] = candidates
+    print(len(candidates["event"]), "merged photon candidates saved in", MERGED_FILE)
+    print("results saved")
+
+
+# Draws and saves the plots (also later, from saved histograms: plot_results.py)
+def plot():
+    c_pi0_vs_reco = ROOT.TCanvas("c_pi0_vs_reco", "gen π⁰ count vs Reco photons", 800, 600)
+    hist_pi0count_vs_nreco.Draw("COLZ")
+    c_pi0_vs_reco.SaveAs("pi0_vs_reco_photons.png")
+
+    c_nreco_vs_minDR = ROOT.TCanvas("c_nreco_vs_minDR", "Reco Count vs Min DR", 800, 600)
+    hist_nreco_vs_minDR.Draw("COLZ")
+    c_nreco_vs_minDR.SaveAs("nreco_vs_minDR.png")
+
+    c_genDR = ROOT.TCanvas("c_genDR", "ΔR Between Gen Photon Pairs", 800, 600)
+    hist_genDeltaR.Draw()
+    c_genDR.SaveAs("genPhotonPairDeltaR.png")
+
+    c_genPhoDR = ROOT.TCanvas("c_genPhoDR", "ΔR Between Gen Photons from π⁰", 800, 600)
+    hist_genPhoDeltaR.SetLineColor(ROOT.kRed+1)
+    hist_genPhoDeltaR.Draw()
+    c_genPhoDR.SaveAs("genPhoDeltaR_pi0.png")
+
+    for key, hist in hist_by_class.items():
+        c = ROOT.TCanvas(f"c_class_{key}", f"Mass Distribution: Class {key}", 800, 600)
+        hist.SetLineWidth(2)
+        hist.SetLineColor(ROOT.kAzure + ord(key))
+        hist.Draw()
+        c.SaveAs(f"mass_by_class_{key}.png")
+
+    for key, hist in hist_multi_by_class.items():
+        c = ROOT.TCanvas(f"c_multi_class_{key}", f"Best disjoint pairs: Class {key}", 800, 600)
+        hist.SetLineWidth(2)
+        hist.SetLineColor(ROOT.kAzure + ord(key))
+        hist.Draw()
+        c.SaveAs(f"mass_multi_class_{key}.png")
+
+
+if __name__ == "__main__":
+    driver.run(input_file, [sys.modules[__name__]])
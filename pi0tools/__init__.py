@@ -0,0 +1,8 @@
+"""
+Shared helpers for the pi0 reconstruction analyses.
+
+The analysis scripts in the sub-directories read the "outtree" written by
+miniTreeForAnneMarie.py. The modules here let them do so in chunks of events,
+with the per-photon vectors stored as flat offset+content numpy arrays instead
+of one std::vector<double> per event.
+"""
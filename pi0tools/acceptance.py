@@ -0,0 +1,97 @@
+"""
+Per-file acceptance summary of a miniTree: the theta range of the reco photons
+and the event/photon counts.
+
+miniTreeForAnneMarie.py stores it as TParameter<double> objects in the
+"acceptance" directory of its output file. For files produced before that, it
+is computed once from the tree (a columnar pass over photonPx/Py/Pz only) and
+kept in a "<file>.acceptance.json" sidecar, which is recomputed when the size or
+modification time of the ROOT file changes.
+
+The summary of several files (a dataset) is merged like the TParameters by
+hadd: the smallest thetaMin, the largest thetaMax and the summed counts.
+"""
+import json
+import os
+
+import numpy as np
+import uproot
+
+from pi0tools import kinematics, reader
+
+DIRECTORY = "acceptance"
+KEYS = ["thetaMin", "thetaMax", "nEvents", "nPhotons", "nGenPhotons", "nGenPi0s"]
+# how the summaries of several files combine
+MERGE = {"thetaMin": min, "thetaMax": max}
+
+_merged = {}  # dataset summaries read in this process, by files and their file_key()
+
+
+def file_key(filename):
+    stat = os.stat(filename)
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+def sidecar_name(filename):
+    return filename + ".acceptance.json"
+
+
+def _from_file(filename):
+    with uproot.open(filename) as infile:
+        if DIRECTORY not in infile:
+            return None
+        return {key: float(infile[DIRECTORY + "/" + key].member("fVal")) for key in KEYS}
+
+
+def _from_sidecar(filename):
+    try:
+        with open(sidecar_name(filename)) as sidecar:
+            cached = json.load(sidecar)
+    except (OSError, ValueError):
+        return None
+    if cached.get("source") != file_key(filename):
+        return None
+    return cached["acceptance"]
+
+
+def compute(filename, step_size=reader.DEFAULT_STEP):
+    """Acceptance summary from the tree itself."""
+    summary = {"thetaMin": np.inf, "thetaMax": -np.inf, "nEvents": 0,
+               "nPhotons": 0, "nGenPhotons": 0, "nGenPi0s": 0}
+    branches = reader.vector_branches("photon", components=("Px", "Py", "Pz")) + ["genPhotonE", "genPi0E"]
+    for batch in reader.iterate(filename, branches, step_size=step_size, optional=["photonTheta"]):
+        theta = kinematics.column(batch, "photon", "Theta").content
+        if len(theta):
+            summary["thetaMin"] = min(summary["thetaMin"], float(theta.min()))
+            summary["thetaMax"] = max(summary["thetaMax"], float(theta.max()))
+        summary["nEvents"] += len(batch)
+        summary["nPhotons"] += len(theta)
+        summary["nGenPhotons"] += len(batch["genPhotonE"].content)
+        summary["nGenPi0s"] += len(batch["genPi0E"].content)
+    return summary
+
+
+def merge(summaries):
+    """Acceptance summary of several files from theirs."""
+    summaries = list(summaries)
+    return {key: MERGE.get(key, sum)(summary[key] for summary in summaries) for key in KEYS}
+
+
+def read(filename):
+    """Acceptance summary of a miniTree file, from the file, the sidecar or the tree; of a list of files, merged."""
+    if isinstance(filename, (list, tuple)):
+        key = tuple((name, tuple(file_key(name).values())) for name in filename)
+        if key not in _merged:
+            _merged[key] = merge(read(name) for name in filename)
+        return _merged[key]
+    summary = _from_file(filename)
+    if summary is None:
+        summary = _from_sidecar(filename)
+    if summary is None:
+        summary = compute(filename)
+        try:
+            with open(sidecar_name(filename), "w") as sidecar:
+                json.dump({"source": file_key(filename), "acceptance": summary}, sidecar, indent=1)
+        except OSError:
+            pass  # read-only area, recompute next time
+    return summary
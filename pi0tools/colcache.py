@@ -0,0 +1,158 @@
+"""
+Uncompressed columnar cache of a miniTree, read through memory mapping.
+
+write() decodes the ROOT baskets of the outtree once and stores every branch
+as a raw binary array in "<file>.columns/": "<branch>.values" for the scalar
+branches, "<branch>.offsets" (int64, nEvents+1) and "<branch>.content" for
+the vector branches, with their dtypes and lengths in "meta.json". load()
+maps them with numpy.memmap, so a chunk of events is a view of the page cache
+instead of a decompression, and the processes of sweep.py share the same
+pages.
+
+The cache is keyed by the size, modification time and SHA-1 of the ROOT file:
+it is used as long as size and mtime are unchanged, and when only the mtime
+differs (a copy, a touch) the hash decides. pi0tools/reader.py uses it
+automatically when it holds the branches asked for.
+
+    python column_cache.py miniTree.root miniTreeAM_modifEcal2.root
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import awkward as ak
+import numpy as np
+import uproot
+
+VERSION = 1
+META = "meta.json"
+DEFAULT_STEP = 100000
+
+
+def cache_name(filename):
+    return filename + ".columns"
+
+
+def file_hash(filename, block=1 << 24):
+    digest = hashlib.sha1()
+    with open(filename, "rb") as infile:
+        for chunk in iter(lambda: infile.read(block), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_key(filename, with_hash=True):
+    stat = os.stat(filename)
+    key = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+    if with_hash:
+        key["sha1"] = file_hash(filename)
+    return key
+
+
+class ColumnCache:
+    """The memory-mapped branches of one cached tree."""
+
+    def __init__(self, directory, meta):
+        self.directory = directory
+        self.meta = meta
+        self.num_entries = meta["entries"]
+
+    def keys(self):
+        return list(self.meta["branches"])
+
+    def __contains__(self, name):
+        return name in self.meta["branches"]
+
+    def _map(self, name, suffix, dtype, length):
+        if length == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(os.path.join(self.directory, name + suffix), dtype=dtype, mode="r", shape=(length,))
+
+    def column(self, name, entry_start, entry_stop):
+        """Events [entry_start, entry_stop) of a branch: numpy array, or (offsets, content) views of a vector branch."""
+        info = self.meta["branches"][name]
+        if not info["jagged"]:
+            return np.asarray(self._map(name, ".values", info["dtype"], self.num_entries)[entry_start:entry_stop])
+        offsets = self._map(name, ".offsets", np.int64, self.num_entries + 1)[entry_start:entry_stop + 1]
+        content = self._map(name, ".content", info["dtype"], info["length"])[offsets[0]:offsets[-1]]
+        return np.asarray(offsets) - offsets[0], np.asarray(content)
+
+
+def load(filename, treename="outtree"):
+    """ColumnCache of an up-to-date cache of the tree, None if there is none."""
+    directory = cache_name(filename)
+    try:
+        with open(os.path.join(directory, META)) as infile:
+            meta = json.load(infile)
+        key = source_key(filename, with_hash=False)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != VERSION or meta.get("tree") != treename:
+        return None
+    source = meta["source"]
+    if source["size"] != key["size"]:
+        return None
+    if source["mtime"] != key["mtime"]:
+        # same size, touched or copied: the content decides
+        if file_hash(filename) != source["sha1"]:
+            return None
+        meta["source"]["mtime"] = key["mtime"]
+        try:
+            _write_meta(directory, meta)
+        except OSError:
+            pass  # read-only area, hash again next time
+    return ColumnCache(directory, meta)
+
+
+def _write_meta(directory, meta):
+    with open(os.path.join(directory, META) + ".tmp", "w") as outfile:
+        json.dump(meta, outfile, indent=1)
+    os.replace(os.path.join(directory, META) + ".tmp", os.path.join(directory, META))
+
+
+def write(filename, treename="outtree", step_size=DEFAULT_STEP):
+    """Cache all the branches of the tree next to the file. Returns the cache directory."""
+    directory = cache_name(filename)
+    building = directory + ".tmp"
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+    key = source_key(filename)
+
+    branches = {}
+    outfiles = {}
+    with uproot.open(filename) as infile:
+        tree = infile[treename]
+        n_entries = tree.num_entries
+        for arrays in tree.iterate(step_size=step_size, library="ak"):
+            for name in arrays.fields:
+                array = arrays[name]
+                jagged = array.ndim > 1
+                if name not in outfiles:
+                    suffixes = (".offsets", ".content") if jagged else (".values",)
+                    outfiles[name] = [open(os.path.join(building, name + suffix), "wb") for suffix in suffixes]
+                    branches[name] = {"jagged": jagged, "dtype": None, "length": 0}
+                    if jagged:
+                        np.zeros(1, dtype=np.int64).tofile(outfiles[name][0])
+                info = branches[name]
+                if jagged:
+                    counts = ak.to_numpy(ak.num(array)).astype(np.int64)
+                    content = ak.to_numpy(ak.flatten(array))
+                    (info["length"] + np.cumsum(counts)).tofile(outfiles[name][0])
+                    content.tofile(outfiles[name][1])
+                else:
+                    content = ak.to_numpy(array)
+                    content.tofile(outfiles[name][0])
+                info["length"] += len(content)
+                info["dtype"] = content.dtype.str
+    for handles in outfiles.values():
+        for handle in handles:
+            handle.close()
+
+    _write_meta(building, {"version": VERSION, "tree": treename, "source": key,
+                           "entries": n_entries, "branches": branches})
+    # swap in the complete cache only, so that readers never see a partial one
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(building, directory)
+    return directory
+
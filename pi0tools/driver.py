@@ -0,0 +1,135 @@
+"""
+Event loop shared by the analysis scripts.
+
+An analysis is a script module defining
+    branches            branches it reads
+    optional_branches   branches read only when the file has them (optional)
+    start(input_file)   called before the first chunk (optional)
+    process(batch)      called for each chunk of events
+    finish()            called after the last chunk: fits, output files (optional)
+    plot()              draws the histograms and saves the PNGs (optional)
+    cell_size           ECAL cell size of the sample, for the resolution lines
+                        (optional, overridden by run(..., cell_size=...))
+    matching_mode       "greedy" or "optimal" reco/gen matching
+                        (optional, overridden by run(..., matching_mode=...))
+    accumulators        what process() accumulates besides the histograms, as
+                        {module attribute: merge rule} (optional, used to
+                        merge the results of several files: pi0tools/results.py)
+
+Optional branches that are not in the tree are read from the match table of
+the input file (pi0tools/matchtable.py) when it has them.
+
+Every script runs itself with run(input_file, [module]). run_analyses.py runs
+several of them on the same chunks, so that the tree is decoded once and what
+is cached on the batch (angles, Delta R matrix) is computed once for all.
+
+With run(..., plots=False) no canvas is made (headless batch jobs): save()
+writes the histograms of the analyses to a file, and restore() puts them back
+into the modules of a later process, whose plot() then makes the PNGs
+(plot_results.py).
+
+run() is setup() (settings, start()), loop() (process() of every chunk) and
+end() (finish(), plot()); run_dataset.py calls them apart, to loop over the
+files of a dataset one by one and finish on their merged results.
+"""
+import json
+
+import ROOT
+
+from pi0tools import matchtable, reader
+
+# module attributes that plot() may need besides the histograms, kept by save()
+SETTINGS = ["cell_size", "matching_mode"]
+
+
+def _union(lists):
+    names = []
+    for names_ in lists:
+        names.extend(name for name in names_ if name not in names)
+    return names
+
+
+def setup(analyses, input_file, cell_size=None, matching_mode=None):
+    """Applies the settings given and calls start(input_file); input_file may be a list of files (a dataset)."""
+    settings = {"cell_size": cell_size, "matching_mode": matching_mode}
+    for analysis in analyses:
+        for name, value in settings.items():
+            if value is not None and hasattr(analysis, name):
+                setattr(analysis, name, value)
+        if hasattr(analysis, "start"):
+            analysis.start(input_file)
+
+
+def loop(input_file, analyses, step_size=reader.DEFAULT_STEP):
+    """Hands every chunk of input_file to the process() of the analyses."""
+    branches = _union(analysis.branches for analysis in analyses)
+    optional = _union(getattr(analysis, "optional_branches", []) for analysis in analyses)
+    # the match table of the file, if one of the analyses can use it
+    friends = []
+    if any(name in matchtable.BRANCHES for name in optional):
+        table = matchtable.find(input_file)
+        if table is not None:
+            friends.append((table, matchtable.TREE_NAME))
+    for batch in reader.iterate(input_file, branches, step_size=step_size, optional=optional, friends=friends):
+        for analysis in analyses:
+            analysis.process(batch)
+
+
+def end(analyses, plots=True):
+    """finish(), then plot() unless plots is False, of every analysis."""
+    for analysis in analyses:
+        if hasattr(analysis, "finish"):
+            analysis.finish()
+        if plots and hasattr(analysis, "plot"):
+            analysis.plot()
+
+
+def run(input_file, analyses, step_size=reader.DEFAULT_STEP, cell_size=None, matching_mode=None, plots=True):
+    if not plots:
+        ROOT.gROOT.SetBatch(True)  # no graphics at all
+    setup(analyses, input_file, cell_size, matching_mode)
+    loop(input_file, analyses, step_size)
+    end(analyses, plots)
+
+
+def _slots(analysis):
+    # (name, module attribute, dict key or None, histogram) of every histogram booked at module level
+    for name, value in list(vars(analysis).items()):
+        values = value.items() if isinstance(value, dict) else [(None, value)]
+        for key, hist in list(values):
+            if isinstance(hist, ROOT.TH1):
+                yield (name if key is None else "{}_{}".format(name, key)), name, key, hist
+
+
+def histograms(analysis):
+    """The histograms an analysis booked at module level (also inside dicts), by name."""
+    return {name: hist for name, attribute, key, hist in _slots(analysis)}
+
+
+def save(filename, names, analyses):
+    """The histograms and SETTINGS of the analyses in filename, as <name>/<histogram> and <name>/settings."""
+    outfile = ROOT.TFile(filename, "RECREATE")
+    for name, analysis in zip(names, analyses):
+        outfile.mkdir(name).cd()
+        for hist_name, hist in histograms(analysis).items():
+            hist.Write(hist_name)
+        settings = {setting: getattr(analysis, setting) for setting in SETTINGS if hasattr(analysis, setting)}
+        ROOT.TNamed("settings", json.dumps(settings)).Write()
+    outfile.Close()
+
+
+def restore(analysis, directory):
+    """Puts the histograms and settings saved by save() in directory back into an analysis module."""
+    for name, attribute, key, hist in list(_slots(analysis)):
+        stored = directory.Get(name)
+        if not stored:
+            continue
+        stored.SetDirectory(0)
+        if key is None:
+            setattr(analysis, attribute, stored)
+        else:
+            getattr(analysis, attribute)[key] = stored
+    settings = directory.Get("settings")
+    if settings:
+        for setting, value in json.loads(settings.GetTitle()).items():
+            setattr(analysis, setting, value)
@@ -0,0 +1,91 @@
+"""
+Columnar access to the edm4hep collections of the reconstruction output
+("events" tree), used by miniTreeForAnneMarie.py instead of calling getPDG(),
+getEnergy(), getMomentum() ... object by object through podio.
+
+The members of a collection are read N events at a time as Jagged arrays named
+like their branches, e.g. "MCParticles.PDG" or "PandoraPFOs.momentum.x".
+"""
+import numpy as np
+
+from pi0tools import reader
+
+EVENTS_TREE = "events"
+
+# members needed by the producer, MCParticle has no stored energy
+MC_MEMBERS = ["PDG", "generatorStatus", "mass", "momentum.x", "momentum.y", "momentum.z",
+              "parents_begin", "parents_end"]
+RECO_MEMBERS = ["PDG", "energy", "mass", "momentum.x", "momentum.y", "momentum.z"]
+
+
+def branches(collection, members):
+    return [collection + "." + member for member in members]
+
+
+def relation_branch(collection, relation):
+    # podio keeps the targets of a OneToMany relation in "_<collection>_<relation>"
+    return "_" + collection + "_" + relation + ".index"
+
+
+def iterate(filenames, branch_names, step_size=reader.DEFAULT_STEP):
+    """Batches of the events tree of all the files, in the order given."""
+    for filename in filenames:
+        for batch in reader.iterate(filename, branch_names, step_size=step_size, treename=EVENTS_TREE):
+            yield batch
+
+
+def four_vectors(batch, collection):
+    """
+    Jagged E, P, Px, Py, Pz and M (float64) of every object of a collection.
+    E is taken from the "energy" member if it was read, otherwise computed as
+    sqrt(p^2 + m^2) like MCParticle::getEnergy.
+    """
+    px, py, pz, mass = (batch[collection + "." + member]
+                        for member in ("momentum.x", "momentum.y", "momentum.z", "mass"))
+    px_, py_, pz_, mass_ = (column.content.astype(np.float64) for column in (px, py, pz, mass))
+    p2 = px_ * px_ + py_ * py_ + pz_ * pz_
+    if collection + ".energy" in batch:
+        energy = batch[collection + ".energy"].content.astype(np.float64)
+    else:
+        energy = np.sqrt(p2 + mass_ * mass_)
+    values = {"E": energy, "P": np.sqrt(p2), "Px": px_, "Py": py_, "Pz": pz_, "M": mass_}
+    return {name: px.with_content(value) for name, value in values.items()}
+
+
+def select(columns, mask):
+    """Keep the objects where mask (flat, one entry per object) is True."""
+    return {name: column.select(mask) for name, column in columns.items()}
+
+
+def first_parent(batch, collection):
+    """
+    Flat index of the first parent of every object of a collection (parents are
+    in the same collection, as for the MCParticles), -1 if it has none.
+    """
+    begin = batch[collection + ".parents_begin"]
+    end = batch[collection + ".parents_end"]
+    links = batch[relation_branch(collection, "parents")]
+    parent = np.full(len(begin.content), -1, dtype=np.int64)
+    has_parent = end.content > begin.content
+    event = begin.event_index[has_parent]
+    local = links.content[links.offsets[event] + begin.content[has_parent]]
+    parent[has_parent] = begin.offsets[event] + local
+    return parent
+
+
+def first_two(groups, values, n_groups):
+    """Smallest and second smallest of the values of every group, -1 when missing."""
+    first = np.full(n_groups, np.iinfo(np.int64).max)
+    np.minimum.at(first, groups, values)
+    later = values != first[groups]
+    second = np.full(n_groups, np.iinfo(np.int64).max)
+    np.minimum.at(second, groups[later], values[later])
+    missing = np.iinfo(np.int64).max
+    return np.where(first == missing, -1, first), np.where(second == missing, -1, second)
+
+
+def selected_index(jagged, mask):
+    """Index of every object inside its event after select(mask), -1 if not selected."""
+    rank = np.cumsum(mask) - 1
+    selected_before = np.concatenate(([0], np.cumsum(mask)))[jagged.offsets]
+    return np.where(mask, rank - selected_before[jagged.event_index], -1)
@@ -0,0 +1,65 @@
+"""
+(eta, phi) grid index for finding the photon pairs closer than a Delta R radius
+without trying every (target, candidate) pair of an event.
+
+The candidates are hashed into cells of at least radius x radius in eta and
+phi (phi wraps around at +-pi); a pair with Delta R < radius is always in the
+same or in neighbouring cells, so only the 3 x 3 cells around each target are
+looked up.
+"""
+import numpy as np
+
+from pi0tools import kinematics
+
+# |eta| beyond this goes to the last cell (the photons along the beam have eta = +-10e10)
+ETA_MAX = 10.0
+
+
+def _cells(eta, phi, radius):
+    n_eta = int(np.ceil(ETA_MAX / radius))
+    n_phi = max(1, int(np.floor(2 * np.pi / radius)))
+    ieta = np.clip(np.floor(eta / radius), -n_eta, n_eta).astype(np.int64) + n_eta
+    iphi = np.minimum(np.floor((phi + np.pi) / (2 * np.pi) * n_phi).astype(np.int64), n_phi - 1)
+    return ieta, iphi, 2 * n_eta + 1, n_phi
+
+
+def _key(event, ieta, iphi, n_eta, n_phi):
+    return (event * n_eta + ieta) * n_phi + iphi
+
+
+def pairs_within(target_eta, target_phi, cand_eta, cand_phi, radius):
+    """
+    Flat (target, candidate) indices of the pairs of the same event with
+    Delta R < radius, ordered by target then candidate like the rows of a
+    DeltaRMatrix, and their Delta R.
+    """
+    t_ieta, t_iphi, n_eta, n_phi = _cells(target_eta.content, target_phi.content, radius)
+    c_ieta, c_iphi, _, _ = _cells(cand_eta.content, cand_phi.content, radius)
+    t_event, c_event = target_eta.event_index, cand_eta.event_index
+
+    # candidates sorted by cell, each cell a contiguous range
+    c_key = _key(c_event, c_ieta, c_iphi, n_eta, n_phi)
+    order = np.argsort(c_key, kind="stable")
+    c_key = c_key[order]
+
+    phi_steps = (-1, 0, 1) if n_phi >= 3 else range(n_phi)
+    targets, cands = [], []
+    for deta in (-1, 0, 1):
+        ieta = t_ieta + deta
+        inside = (ieta >= 0) & (ieta < n_eta)
+        for dphi in phi_steps:
+            key = _key(t_event, ieta, (t_iphi + dphi) % n_phi, n_eta, n_phi)[inside]
+            lo = np.searchsorted(c_key, key, side="left")
+            hi = np.searchsorted(c_key, key, side="right")
+            counts = hi - lo
+            start = np.repeat(lo - np.cumsum(counts) + counts, counts)
+            targets.append(np.repeat(np.flatnonzero(inside), counts))
+            cands.append(order[start + np.arange(counts.sum())])
+    target, cand = np.concatenate(targets), np.concatenate(cands)
+
+    dr = kinematics.delta_r(cand_eta.content[cand], cand_phi.content[cand],
+                            target_eta.content[target], target_phi.content[target])
+    close = dr < radius
+    target, cand, dr = target[close], cand[close], dr[close]
+    order = np.lexsort((cand, target))
+    return target[order], cand[order], dr[order]
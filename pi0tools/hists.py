@@ -0,0 +1,21 @@
+"""
+Filling ROOT histograms from numpy arrays in one call (TH1::FillN) instead of
+one Fill per entry.
+"""
+import numpy as np
+import ROOT
+
+
+def _doubles(values):
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+
+def fill(hist, x, y=None, weights=None):
+    x = _doubles(x)
+    if len(x) == 0:
+        return
+    w = ROOT.nullptr if weights is None else _doubles(weights)
+    if y is None:
+        hist.FillN(len(x), x, w)
+    else:
+        hist.FillN(len(x), x, _doubles(np.broadcast_to(y, x.shape)), w)
@@ -0,0 +1,109 @@
+"""
+Cheap stage timers and counters for long loops (the producer event loop).
+
+The time of a loop is cut in laps: lap(name) charges the time since the
+previous lap to the stage name, so timing a stage costs one perf_counter call
+and nothing is nested. Counters add up numbers of objects; add_events() counts
+the events, and prints a progress line (events, events/s, share of every
+stage, RSS) every report_every events.
+
+summary() gives everything as a dict, written as JSON by write(); the
+summaries of parallel workers are folded into the one of the parent with
+add(), so that a -j run gets a single summary.
+"""
+import json
+import os
+import resource
+import time
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_mb():
+    """Current resident memory of the process [MB], the peak one where /proc is missing."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE / 1048576.0
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0  # kB on Linux
+
+
+class Instruments:
+
+    def __init__(self, report_every=10000, label=""):
+        self.report_every = report_every
+        self.label = label
+        self.times = {}
+        self.counters = {}
+        self.events = 0
+        self.workers = []
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.next_report = report_every if report_every > 0 else None
+
+    def mark(self):
+        # start of the next lap, the time since the previous one is not charged
+        self.last = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.times[name] = self.times.get(name, 0.0) + now - self.last
+        self.last = now
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_events(self, n=1):
+        self.events += n
+        if self.next_report is not None and self.events >= self.next_report:
+            self.report()
+            while self.next_report <= self.events:
+                self.next_report += self.report_every
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def report(self):
+        elapsed = self.elapsed()
+        total = sum(self.times.values()) or 1.0
+        shares = " ".join("{} {:.0%}".format(name, seconds / total) for name, seconds in self.times.items())
+        print("{}{} events, {:.0f} events/s, {}, RSS {:.0f} MB".format(
+            self.label + ": " if self.label else "", self.events, self.events / elapsed if elapsed > 0 else 0.0,
+            shares, rss_mb()), flush=True)
+
+    def add(self, summary):
+        """Folds in the summary of a worker (or of an earlier block): stage times, counters and events add up."""
+        for name, stage in summary["stages"].items():
+            self.times[name] = self.times.get(name, 0.0) + stage["seconds"]
+        for name, counter in summary["counters"].items():
+            self.counters[name] = self.counters.get(name, 0) + counter["total"]
+        self.events += summary["events"]
+        self.workers.append({key: summary[key] for key in ("label", "events", "wall", "peak_rss_mb")})
+
+    def summary(self):
+        wall = self.elapsed()
+        events = max(self.events, 1)
+        total = sum(self.times.values()) or 1.0
+        return {
+            "label": self.label,
+            "events": self.events,
+            "wall": wall,
+            "events_per_s": self.events / wall if wall > 0 else 0.0,
+            "stages": {name: {"seconds": seconds, "fraction": seconds / total, "us_per_event": 1e6 * seconds / events}
+                       for name, seconds in self.times.items()},
+            "counters": {name: {"total": n, "per_event": n / events} for name, n in self.counters.items()},
+            "rss_mb": rss_mb(),
+            "peak_rss_mb": max([peak_rss_mb()] + [worker["peak_rss_mb"] for worker in self.workers]),
+            "workers": self.workers,
+        }
+
+    def write(self, filename):
+        summary = self.summary()
+        with open(filename + ".tmp", "w") as outfile:
+            json.dump(summary, outfile, indent=1)
+        os.replace(filename + ".tmp", filename)
+        return summary
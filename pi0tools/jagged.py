@@ -0,0 +1,63 @@
+"""
+Minimal jagged array: one flat numpy "content" array holding the values of all
+events back to back, and an "offsets" array of length nEvents+1 so that event i
+owns content[offsets[i]:offsets[i+1]].
+"""
+import numpy as np
+
+
+class Jagged:
+
+    def __init__(self, offsets, content):
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.content = np.asarray(content)
+
+    @classmethod
+    def from_counts(cls, counts, content):
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return cls(offsets, content)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.content[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def counts(self):
+        return np.diff(self.offsets)
+
+    @property
+    def starts(self):
+        return self.offsets[:-1]
+
+    @property
+    def event_index(self):
+        # index of the event each element belongs to
+        return np.repeat(np.arange(len(self)), self.counts)
+
+    @property
+    def local_index(self):
+        # position of each element inside its own event
+        return np.arange(len(self.content)) - np.repeat(self.starts, self.counts)
+
+    def with_content(self, content):
+        # same event structure, different values (e.g. a derived quantity)
+        return Jagged(self.offsets, content)
+
+    def select(self, mask):
+        # keep only the elements where mask is True, event structure preserved
+        mask = np.asarray(mask, dtype=bool)
+        kept = np.concatenate(([0], np.cumsum(mask)))
+        return Jagged(kept[self.offsets], self.content[mask])
+
+    def take(self, index):
+        # elements at the given flat positions (sorted by event), grouped by event
+        index = np.asarray(index, dtype=np.int64)
+        events = np.searchsorted(self.offsets, index, side="right") - 1
+        return Jagged.from_counts(np.bincount(events, minlength=len(self)), self.content[index])
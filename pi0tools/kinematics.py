@@ -0,0 +1,57 @@
+"""
+Angular quantities computed on whole arrays with the same formulas as
+TLorentzVector/TVector3, so that cuts give the same answer as the per-event
+ROOT.TLorentzVector code they replace.
+"""
+import numpy as np
+
+
+def theta(px, py, pz):
+    # TVector3::Theta
+    return np.arctan2(np.sqrt(px * px + py * py), pz)
+
+
+def phi(px, py, pz):
+    # TVector3::Phi, atan2(0, 0) is already 0
+    return np.arctan2(py, px)
+
+
+def eta(px, py, pz):
+    # TVector3::PseudoRapidity, including its +-10e10 for photons along the beam
+    mag = np.sqrt(px * px + py * py + pz * pz)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cos_theta = np.where(mag == 0.0, 1.0, pz / mag)
+        result = -0.5 * np.log((1.0 - cos_theta) / (1.0 + cos_theta))
+    along_beam = cos_theta * cos_theta >= 1
+    result[along_beam] = np.where(pz[along_beam] == 0, 0.0, np.copysign(10e10, pz[along_beam]))
+    return result
+
+
+def delta_phi(phi1, phi2):
+    # TVector2::Phi_mpi_pi of the difference
+    dphi = phi1 - phi2
+    dphi = np.where(dphi >= np.pi, dphi - 2 * np.pi, dphi)
+    return np.where(dphi < -np.pi, dphi + 2 * np.pi, dphi)
+
+
+def delta_r(eta1, phi1, eta2, phi2):
+    # TLorentzVector::DeltaR (pseudorapidity version)
+    deta = eta1 - eta2
+    dphi = delta_phi(phi1, phi2)
+    return np.sqrt(deta * deta + dphi * dphi)
+
+
+_FUNCTIONS = {"Theta": theta, "Phi": phi, "Eta": eta}
+
+
+def column(batch, collection, quantity):
+    """
+    Jagged Theta/Phi/Eta of a collection ("photon", "genPhoton", "genPi0"),
+    taken from the batch if the branch was read (files produced with --angles),
+    otherwise computed from its Px/Py/Pz branches and kept on the batch.
+    """
+    name = collection + quantity
+    if name not in batch:
+        px, py, pz = (batch[collection + comp] for comp in ("Px", "Py", "Pz"))
+        batch[name] = px.with_content(_FUNCTIONS[quantity](px.content, py.content, pz.content))
+    return batch[name]
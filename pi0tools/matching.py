@@ -0,0 +1,360 @@
+"""
+Batched Delta R matching between two photon collections.
+
+A DeltaRMatrix holds, for every event of a batch, the Delta R of every
+(target, candidate) pair, flattened target by target. With a radius it keeps
+only the pairs closer than that, found through the (eta, phi) grid of
+pi0tools/grid.py; matching with a cut no larger than the radius gives the same
+matches, at a cost growing with the number of close pairs instead of the
+number of all pairs. Typically the targets are
+the gen photons and the candidates the reco photons, but the roles can be
+swapped (photon_match/min_dr_threshold.py matches reco photons to gen photons).
+
+greedy_match reproduces the one-to-one rule used by the analysis scripts: the
+targets are visited in order and each takes its nearest candidate not already
+used in the same group (the event, or e.g. the gen photon pair), provided that
+Delta R is below the cut.
+
+optimal_match solves the same problem globally for every group: as many
+matches under the cut as possible, and of those the ones with the smallest sum
+of Delta R, whatever the order of the targets.
+"""
+import numpy as np
+
+from pi0tools import grid, kinematics
+
+DR_CUT = 0.04
+
+
+class DeltaRMatrix:
+
+    def __init__(self, target_eta, target_phi, cand_eta, cand_phi, radius=None):
+        self.target_offsets = target_eta.offsets
+        self.cand_offsets = cand_eta.offsets
+        self.n_targets = len(target_eta.content)
+        self.n_cands = len(cand_eta.content)
+        self.target_event = target_eta.event_index
+
+        if radius is not None:
+            # only the close pairs, still target by target
+            self.target, self.cand, self.dr = grid.pairs_within(target_eta, target_phi, cand_eta, cand_phi, radius)
+            self.row_counts = np.bincount(self.target, minlength=self.n_targets)
+            self.row_offsets = np.zeros(self.n_targets + 1, dtype=np.int64)
+            np.cumsum(self.row_counts, out=self.row_offsets[1:])
+            return
+
+        # every target owns a contiguous block of n_cand entries
+        self.row_counts = cand_eta.counts[self.target_event]
+        self.row_offsets = np.zeros(self.n_targets + 1, dtype=np.int64)
+        np.cumsum(self.row_counts, out=self.row_offsets[1:])
+
+        self.target = np.repeat(np.arange(self.n_targets), self.row_counts)
+        local = np.arange(self.row_offsets[-1]) - np.repeat(self.row_offsets[:-1], self.row_counts)
+        self.cand = self.cand_offsets[self.target_event][self.target] + local
+
+        self.dr = kinematics.delta_r(cand_eta.content[self.cand], cand_phi.content[self.cand],
+                                     target_eta.content[self.target], target_phi.content[self.target])
+
+    @classmethod
+    def from_batch(cls, batch, targets="genPhoton", candidates="photon", radius=None):
+        # shared by all the analyses run on the same batch
+        return batch.cached(("DeltaRMatrix", targets, candidates, radius), lambda: cls(
+            kinematics.column(batch, targets, "Eta"), kinematics.column(batch, targets, "Phi"),
+            kinematics.column(batch, candidates, "Eta"), kinematics.column(batch, candidates, "Phi"),
+            radius=radius))
+
+
+def _rows(matrix, targets):
+    # flat matrix entries belonging to the given targets, and the row each one came from
+    counts = matrix.row_counts[targets]
+    row = np.repeat(np.arange(len(targets)), counts)
+    starts = np.zeros(len(targets) + 1, dtype=np.int64)
+    np.cumsum(counts, out=starts[1:])
+    entries = matrix.row_offsets[targets][row] + np.arange(starts[-1]) - starts[row]
+    return entries, row, starts
+
+
+def _row_argmin(values, row, starts):
+    # first position of the minimum of each row, -1 for empty or all-inf rows
+    n_rows = len(starts) - 1
+    best = np.full(n_rows, -1, dtype=np.int64)
+    mins = np.full(n_rows, np.inf)
+    filled = starts[1:] > starts[:-1]
+    if not filled.any():
+        return best, mins
+    mins[filled] = np.minimum.reduceat(values, starts[:-1][filled])
+    hit = np.flatnonzero((values == mins[row]) & np.isfinite(values))
+    hit_rows = row[hit]
+    first = np.ones(len(hit), dtype=bool)
+    first[1:] = hit_rows[1:] != hit_rows[:-1]
+    best[hit_rows[first]] = hit[first]
+    return best, mins
+
+
+def nearest(matrix, cand_mask=None):
+    """Index of the closest candidate of each target (-1 if none) and its Delta R."""
+    values = matrix.dr
+    if cand_mask is not None:
+        values = np.where(cand_mask[matrix.cand], values, np.inf)
+    targets = np.arange(matrix.n_targets)
+    entries, row, starts = _rows(matrix, targets)
+    best, mins = _row_argmin(values[entries], row, starts)
+    # gathered only where there is one, the matrix may have no entries at all
+    index = np.full(len(best), -1, dtype=np.int64)
+    index[best >= 0] = matrix.cand[entries[best[best >= 0]]]
+    return index, mins
+
+
+def nearest_two(matrix):
+    """Closest and second closest candidate of every target (-1 if none) and their Delta R."""
+    order = np.lexsort((np.arange(len(matrix.dr)), matrix.dr, matrix.target))
+    best, second = np.full(matrix.n_targets, -1), np.full(matrix.n_targets, -1)
+    best_dr, second_dr = np.full(matrix.n_targets, np.inf), np.full(matrix.n_targets, np.inf)
+    for rank, index, dr in ((0, best, best_dr), (1, second, second_dr)):
+        has = matrix.row_counts > rank
+        entry = order[matrix.row_offsets[:-1][has] + rank]
+        index[has] = matrix.cand[entry]
+        dr[has] = matrix.dr[entry]
+    return best, best_dr, second, second_dr
+
+
+def greedy_match(matrix, cut=DR_CUT, target_mask=None, cand_mask=None, group=None, rank=None,
+                 skip_used=True):
+    """
+    One-to-one greedy matching, returning for every target the index of the
+    matched candidate (-1 if unmatched) and the Delta R to its nearest
+    available candidate (inf if there was none).
+
+    cut         match only if Delta R < cut (None: no cut)
+    target_mask targets taking part; the others stay unmatched
+    cand_mask   candidates that can be used
+    group       targets with the same group id share the list of used candidates
+                (default: the event)
+    rank        order in which the targets of a group are visited (default: index)
+    skip_used   True: take the nearest unused candidate;
+                False: take the nearest candidate and drop the target if it is used
+    """
+    match = np.full(matrix.n_targets, -1, dtype=np.int64)
+    match_dr = np.full(matrix.n_targets, np.inf)
+    if group is None:
+        group = matrix.target_event
+    if rank is None:
+        rank = np.arange(matrix.n_targets)
+    active = np.arange(matrix.n_targets)
+    if target_mask is not None:
+        active = active[target_mask]
+    if len(active) == 0:
+        return match, match_dr
+
+    # step k visits the k-th target of every group at once
+    order = active[np.lexsort((rank[active], group[active]))]
+    new_group = np.concatenate(([True], group[order][1:] != group[order][:-1]))
+    group_start = np.maximum.accumulate(np.where(new_group, np.arange(len(order)), 0))
+    step = np.arange(len(order)) - group_start
+    step_match = np.full(len(order), -1, dtype=np.int64)
+
+    for k in range(step.max() + 1):
+        position = np.flatnonzero(step == k)
+        targets = order[position]
+        entries, row, starts = _rows(matrix, targets)
+        cands = matrix.cand[entries]
+
+        # candidates already taken by the k earlier targets of the same group
+        used = np.zeros(len(entries), dtype=bool)
+        for j in range(k):
+            used |= cands == step_match[group_start[position] + j][row]
+
+        available = np.ones(len(entries), dtype=bool) if cand_mask is None else cand_mask[cands]
+        if skip_used:
+            available &= ~used
+        best, mins = _row_argmin(np.where(available, matrix.dr[entries], np.inf), row, starts)
+
+        found = best >= 0
+        accept = found if cut is None else found & (mins < cut)
+        if not skip_used:
+            taken = np.zeros(len(targets), dtype=bool)
+            taken[found] = used[best[found]]
+            accept &= ~taken
+        step_match[position[accept]] = cands[best[accept]]
+        match[targets[accept]] = cands[best[accept]]
+        match_dr[targets] = mins
+    return match, match_dr
+
+
+# groups whose smaller side (targets or candidates) is at most this are solved
+# with the batched DP, the others one by one with the Hungarian algorithm
+DP_MAX_SIZE = 8
+_DP_MAX_STATES = 1 << 22  # groups x columns x masks of one DP batch
+
+
+def optimal_match(matrix, cut=DR_CUT, target_mask=None, cand_mask=None, group=None):
+    """
+    One-to-one matching minimizing, in every group (default: the event), the
+    sum of Delta R of the largest possible set of matches under the cut.
+    Arguments and return values as for greedy_match, match_dr being the Delta R
+    of the match (inf for unmatched targets).
+    """
+    match = np.full(matrix.n_targets, -1, dtype=np.int64)
+    match_dr = np.full(matrix.n_targets, np.inf)
+    if group is None:
+        group = matrix.target_event
+    allowed = np.isfinite(matrix.dr)
+    if target_mask is not None:
+        allowed &= target_mask[matrix.target]
+    if cand_mask is not None:
+        allowed &= cand_mask[matrix.cand]
+    if cut is not None:
+        allowed &= matrix.dr < cut
+    entries = np.flatnonzero(allowed)
+    if len(entries) == 0:
+        return match, match_dr
+
+    # rows (targets) and columns (candidates) with an allowed entry, numbered in each group
+    groups, entry_group = np.unique(group[matrix.target[entries]], return_inverse=True)
+    n_groups = len(groups)
+    rows, entry_row = np.unique(entry_group * matrix.n_targets + matrix.target[entries], return_inverse=True)
+    cols, entry_col = np.unique(entry_group * matrix.n_cands + matrix.cand[entries], return_inverse=True)
+    row_target, col_cand = rows % matrix.n_targets, cols % matrix.n_cands
+    row_start = np.searchsorted(rows // matrix.n_targets, np.arange(n_groups + 1))
+    col_start = np.searchsorted(cols // matrix.n_cands, np.arange(n_groups + 1))
+    entry_row = entry_row - row_start[entry_group]
+    entry_col = entry_col - col_start[entry_group]
+    n_rows, n_cols = np.diff(row_start), np.diff(col_start)
+
+    # every match is worth more than the sum of Delta R of any set of matches
+    dr = matrix.dr[entries]
+    group_max = np.zeros(n_groups)
+    np.maximum.at(group_max, entry_group, dr)
+    reward = group_max * np.minimum(n_rows, n_cols) + 1.0
+    entry_cost = dr - reward[entry_group]
+
+    # solve the groups of the same shape together, with the smaller side first
+    transpose = n_rows > n_cols
+    small, large = np.where(transpose, n_cols, n_rows), np.where(transpose, n_rows, n_cols)
+    entry_small = np.where(transpose[entry_group], entry_col, entry_row)
+    entry_large = np.where(transpose[entry_group], entry_row, entry_col)
+    order = np.argsort(entry_group, kind="stable")
+    entry_start = np.searchsorted(entry_group[order], np.arange(n_groups + 1))
+    shapes, shape_of_group = np.unique(np.column_stack((small, large)), axis=0, return_inverse=True)
+    shape_of_group = shape_of_group.ravel()
+    for shape, (n_small, n_large) in enumerate(shapes):
+        in_shape = np.flatnonzero(shape_of_group == shape)
+        counts = entry_start[in_shape + 1] - entry_start[in_shape]
+        position = np.repeat(np.arange(len(in_shape)), counts)
+        shape_entries = order[np.repeat(entry_start[in_shape] - np.cumsum(counts) + counts, counts)
+                              + np.arange(counts.sum())]
+        cost = np.full((len(in_shape), n_small, n_large), np.inf)
+        cost[position, entry_small[shape_entries], entry_large[shape_entries]] = entry_cost[shape_entries]
+        entry_at = np.zeros(cost.shape, dtype=np.int64)
+        entry_at[position, entry_small[shape_entries], entry_large[shape_entries]] = shape_entries
+        if n_small <= DP_MAX_SIZE:
+            step = max(1, _DP_MAX_STATES // (n_large << n_small))
+            chosen = np.concatenate([_assignment_dp(cost[s:s + step]) for s in range(0, len(in_shape), step)])
+        else:
+            chosen = np.array([_hungarian(c) for c in cost])
+        at, i, j = np.nonzero(chosen)
+        g = in_shape[at]
+        row = np.where(transpose[g], j, i) + row_start[g]
+        col = np.where(transpose[g], i, j) + col_start[g]
+        match[row_target[row]] = col_cand[col]
+        match_dr[row_target[row]] = dr[entry_at[at, i, j]]
+    return match, match_dr
+
+
+def _assignment_dp(cost):
+    """
+    Batched assignment DP for groups of the same shape (groups, rows, columns),
+    rows <= columns, inf for the forbidden entries: the columns are taken in
+    turn, each assigned to an unused row or to none, best[mask] being the
+    smallest cost with the rows in mask used. Returns the chosen (row, column)
+    entries as a boolean array of the same shape.
+    """
+    n_groups, n_rows, n_cols = cost.shape
+    masks = np.arange(1 << n_rows)
+    with_row = [masks[(masks >> i) & 1 == 1] for i in range(n_rows)]
+    best = np.full((n_groups, 1 << n_rows), np.inf)
+    best[:, 0] = 0.0
+    choice = np.empty((n_cols, n_groups, 1 << n_rows), dtype=np.int8)
+    for j in range(n_cols):
+        # values[0]: column j left alone, values[i + 1]: column j given to row i
+        values = np.full((n_rows + 1, n_groups, 1 << n_rows), np.inf)
+        values[0] = best
+        for i in range(n_rows):
+            values[i + 1][:, with_row[i]] = best[:, with_row[i] ^ (1 << i)] + cost[:, i, j][:, None]
+        choice[j] = values.argmin(axis=0) - 1
+        best = np.take_along_axis(values, choice[j][None].astype(np.int64) + 1, axis=0)[0]
+
+    chosen = np.zeros(cost.shape, dtype=bool)
+    groups = np.arange(n_groups)
+    mask = np.argmin(best, axis=1)
+    for j in range(n_cols - 1, -1, -1):
+        i = choice[j, groups, mask].astype(np.int64)
+        take = i >= 0
+        chosen[groups[take], i[take], j] = True
+        mask[take] ^= 1 << i[take]
+    return chosen
+
+
+def _hungarian(cost):
+    """
+    Hungarian algorithm (potentials, O(rows^2 columns)) for one group, rows <=
+    columns. The forbidden (inf) entries cost 0 like leaving the row unmatched,
+    which is what they mean since all the allowed entries are negative.
+    """
+    n_rows, n_cols = cost.shape
+    cost = np.where(np.isfinite(cost), cost, 0.0)
+    u = np.zeros(n_rows + 1)
+    v = np.zeros(n_cols + 1)
+    owner = np.zeros(n_cols + 1, dtype=np.int64)  # row (from 1) assigned to each column, 0: none
+    way = np.zeros(n_cols + 1, dtype=np.int64)
+    for i in range(1, n_rows + 1):
+        owner[0] = i
+        j0 = 0
+        min_v = np.full(n_cols + 1, np.inf)
+        used = np.zeros(n_cols + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = owner[j0]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            free = ~used[1:]
+            update = free & (reduced < min_v[1:])
+            min_v[1:][update] = reduced[update]
+            way[1:][update] = j0
+            j1 = 1 + np.flatnonzero(free)[np.argmin(min_v[1:][free])]
+            delta = min_v[j1]
+            u[owner[used]] += delta
+            v[used] -= delta
+            min_v[1:][free] -= delta
+            j0 = j1
+            if owner[j0] == 0:
+                break
+        while j0 != 0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+
+    chosen = np.zeros(cost.shape, dtype=bool)
+    for j in np.flatnonzero(owner[1:]):
+        if cost[owner[j + 1] - 1, j] < 0:
+            chosen[owner[j + 1] - 1, j] = True
+    return chosen
+
+
+def match_pairs(batch, first, second, cut=DR_CUT, targets="genPhoton", candidates="photon", mode="greedy",
+                use_grid=False):
+    """
+    Match both photons of each pair (flat indices first[i], second[i], in event
+    order), a candidate being used at most once per pair: the first before the
+    second (mode="greedy") or the best assignment of the two (mode="optimal").
+    Returns the matched candidate and Delta R arrays, shape (nPairs, 2).
+    With use_grid only the candidates within the cut are looked at (same
+    matches; the Delta R of unmatched photons is then inf).
+    """
+    members = np.column_stack((first, second)).ravel()
+    eta = kinematics.column(batch, targets, "Eta").take(members)
+    phi = kinematics.column(batch, targets, "Phi").take(members)
+    matrix = DeltaRMatrix(eta, phi, kinematics.column(batch, candidates, "Eta"),
+                          kinematics.column(batch, candidates, "Phi"), radius=cut if use_grid else None)
+    match_ = optimal_match if mode == "optimal" else greedy_match
+    match, match_dr = match_(matrix, cut=cut, group=np.arange(len(members)) // 2)
+    return match.reshape(-1, 2), match_dr.reshape(-1, 2)
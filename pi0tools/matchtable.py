@@ -0,0 +1,164 @@
+"""
+Reco/gen match table of a miniTree, written once per input file so that the
+scripts do not redo the Delta R matching on every run.
+
+The table is a friend tree "matches" of the outtree, in "<file>.matches.root"
+next to the file: one entry per event, with vectors aligned with the genPhoton
+branches,
+    genPhotonRecoIndex      closest reco photon (index in the event, -1 if none)
+    genPhotonRecoDR         its Delta R (inf if none)
+    genPhotonEnergyRatio    its energy / the gen photon energy (0 if none)
+    genPhotonReco2Index     second closest reco photon, and its Delta R
+    genPhotonReco2DR
+    genPhotonPairId         gen pi0 the photon comes from (genPhotonPi0Index, -1
+                            if not from a pi0 or the file has no parentage)
+and the matching parameters, with the size and modification time of the
+miniTree, as JSON in the "parameters" string; a table that does not belong to
+the file is ignored.
+
+The two closest reco photons are all the one-to-one matching of a gen photon
+pair needs, for any cut and both matching modes: match_pairs gives the same
+matches as matching.match_pairs. The driver reads the table with the outtree
+when an analysis lists BRANCHES in its optional_branches and the file has one.
+
+    python match_table.py miniTree.root miniTreeAM_modifEcal2.root
+"""
+import json
+import os
+
+import awkward as ak
+import numpy as np
+import uproot
+
+from pi0tools import acceptance, matching, parentage, reader
+
+TREE_NAME = "matches"
+VERSION = 1
+BRANCHES = ["genPhotonRecoIndex", "genPhotonRecoDR", "genPhotonEnergyRatio",
+            "genPhotonReco2Index", "genPhotonReco2DR", "genPhotonPairId"]
+
+
+def table_name(filename):
+    return filename + ".matches.root"
+
+
+def parameters(filename):
+    # what the table was made from, compared when it is read back
+    return {"version": VERSION, "source": acceptance.file_key(filename), "targets": "genPhoton",
+            "candidates": "photon", "metric": "deltaR", "nearest": 2}
+
+
+def find(filename):
+    """Name of the up-to-date match table of a miniTree, None if there is none."""
+    name = table_name(filename)
+    if not os.path.exists(name):
+        return None
+    try:
+        with uproot.open(name) as table:
+            stored = json.loads(str(table["parameters"]))
+            n_entries = table[TREE_NAME].num_entries
+    except (OSError, KeyError, ValueError):
+        return None
+    if stored != parameters(filename) or n_entries != reader.num_entries(filename):
+        return None
+    return name
+
+
+def _columns(batch):
+    # the table entries of one chunk, as flat arrays over the gen photons
+    gen_e = batch["genPhotonE"]
+    best, best_dr, second, second_dr = matching.nearest_two(matching.DeltaRMatrix.from_batch(batch))
+    start = batch["photonE"].offsets[gen_e.event_index]
+    ratio = np.zeros(len(best))
+    has = best >= 0
+    ratio[has] = batch["photonE"].content[best[has]] / gen_e.content[has]
+    if parentage.available(batch):
+        pair_id = batch["genPhotonPi0Index"].content.astype(np.int32)
+    else:
+        pair_id = np.full(len(best), -1, dtype=np.int32)
+    return {
+        "RecoIndex": np.where(has, best - start, -1).astype(np.int32),
+        "RecoDR": best_dr,
+        "EnergyRatio": ratio,
+        "Reco2Index": np.where(second >= 0, second - start, -1).astype(np.int32),
+        "Reco2DR": second_dr,
+        "PairId": pair_id,
+    }
+
+
+def write(filename, step_size=reader.DEFAULT_STEP):
+    """Match table of a miniTree, written next to it. Returns its name."""
+    branches = reader.vector_branches("photon", "genPhoton")
+    optional = reader.vector_branches("photon", "genPhoton", components=reader.ANGLES) + parentage.BRANCHES
+    name = table_name(filename)
+    with uproot.recreate(name) as out:
+        out["parameters"] = json.dumps(parameters(filename))
+        tree = None
+        for batch in reader.iterate(filename, branches, step_size=step_size, optional=optional):
+            counts = batch["genPhotonE"].counts
+            record = ak.zip({field: ak.unflatten(values, counts) for field, values in _columns(batch).items()})
+            if tree is None:
+                tree = out.mktree(TREE_NAME, {"genPhoton": record.type.content},
+                                  counter_name=lambda counted: "nGenPhotonMatches",
+                                  field_name=lambda outer, inner: outer + inner)
+            tree.extend({"genPhoton": record})
+    return name
+
+
+def available(batch):
+    return all(name in batch for name in BRANCHES)
+
+
+def _flat(batch, branch):
+    # event-local reco photon indices of the table as flat indices, -1 kept
+    local = batch[branch]
+    return batch.cached(("matchtable", branch), lambda: np.where(
+        local.content >= 0, batch["photonE"].offsets[local.event_index] + local.content, -1).astype(np.int64))
+
+
+def nearest(batch):
+    """Closest reco photon of every gen photon (flat index, -1 if none) and its Delta R, as matching.nearest."""
+    return _flat(batch, "genPhotonRecoIndex"), batch["genPhotonRecoDR"].content
+
+
+def match_pairs(batch, first, second, cut=matching.DR_CUT, mode="greedy"):
+    """
+    matching.match_pairs of the gen photon pairs (first[i], second[i]) from
+    the table. The Delta R returned is that of the nearest available reco
+    photon (greedy) or of the match (optimal), inf if none.
+    """
+    first, second = np.asarray(first, dtype=np.int64), np.asarray(second, dtype=np.int64)
+    best, second_best = _flat(batch, "genPhotonRecoIndex"), _flat(batch, "genPhotonReco2Index")
+    best_dr, second_dr = batch["genPhotonRecoDR"].content, batch["genPhotonReco2DR"].content
+    cut = np.inf if cut is None else cut
+    a1, a2, b1, b2 = best[first], second_best[first], best[second], second_best[second]
+    da1, da2, db1, db2 = best_dr[first], second_dr[first], best_dr[second], second_dr[second]
+
+    if mode == "optimal":
+        # both matched if possible, with the smallest sum: (a1, b1) unless they are the
+        # same reco photon, then (a1, b2) or (a2, b1); else the closer single match
+        options = [(a1, b1, da1, db1), (a1, b2, da1, db2), (a2, b1, da2, db1)]
+        match = np.full((len(first), 2), -1, dtype=np.int64)
+        match_dr = np.full((len(first), 2), np.inf)
+        total = np.full(len(first), np.inf)
+        for a, b, da, db in options:
+            better = (a >= 0) & (b >= 0) & (a != b) & (da < cut) & (db < cut) & (da + db < total)
+            total[better] = (da + db)[better]
+            match[better] = np.column_stack((a, b))[better]
+            match_dr[better] = np.column_stack((da, db))[better]
+        single = ~np.isfinite(total)
+        first_only = single & (da1 < cut) & (da1 <= db1)
+        second_only = single & ~first_only & (db1 < cut)
+        match[first_only, 0], match_dr[first_only, 0] = a1[first_only], da1[first_only]
+        match[second_only, 1], match_dr[second_only, 1] = b1[second_only], db1[second_only]
+        return match, match_dr
+
+    # greedy: the first photon takes its closest reco photon, the second its closest
+    # one, or its second closest if the first photon took it
+    first_ok = da1 < cut
+    taken = first_ok & (b1 == a1)
+    second_match = np.where(taken, b2, b1)
+    second_match_dr = np.where(taken, db2, db1)
+    match = np.column_stack((np.where(first_ok, a1, -1), np.where(second_match_dr < cut, second_match, -1)))
+    return match, np.column_stack((da1, second_match_dr))
+
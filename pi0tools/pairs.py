@@ -0,0 +1,286 @@
+"""
+All the i<j pairs of a photon collection, for every event of a batch at once.
+
+The pairs of an event are in itertools.combinations order (first index, then
+second) and the events follow each other, so that "first pair of an event" or
+"first pair closest to the pi0 mass" give the same answer as the nested loops
+over combinations(photons, 2) with TLorentzVector sums they replace.
+
+mass_window_pairs is the gen photon pairing of eratio.py, n_reco.py,
+match_energy_genpair.py and cut_grid.py for files without the parentage.
+
+best_disjoint picks the pi0 candidates of events with several pi0s: the set of
+disjoint pairs with the smallest total mass chi2, by a bitmask DP batched over
+the events with the same number of photons (branch and bound for the few events
+with more photons).
+"""
+import numpy as np
+
+from pi0tools import kinematics
+from pi0tools.jagged import Jagged
+
+
+class PairTable:
+
+    def __init__(self, e, px, py, pz, eta, phi, scale=1.0):
+        counts = e.counts
+        n_after = (counts[e.event_index] - 1 - e.local_index).astype(np.int64)
+
+        # every photon is the first of a pair with each of the photons after it
+        self.first = np.repeat(np.arange(len(e.content)), n_after)
+        block_start = np.zeros(len(n_after) + 1, dtype=np.int64)
+        np.cumsum(n_after, out=block_start[1:])
+        self.second = self.first + 1 + np.arange(block_start[-1]) - np.repeat(block_start[:-1], n_after)
+        self.event = e.event_index[self.first]
+        self.n_photons = len(e.content)
+        self.offsets = Jagged.from_counts(counts * (counts - 1) // 2, self.first).offsets
+
+        # TLorentzVector (a + b).M(), .Pt() and a.DeltaR(b), the four-vectors
+        # scaled first as the scripts do (scale=1e3 for MeV)
+        e_, px_, py_, pz_ = (column.content * scale for column in (e, px, py, pz))
+        sum_e = e_[self.first] + e_[self.second]
+        sum_px = px_[self.first] + px_[self.second]
+        sum_py = py_[self.first] + py_[self.second]
+        sum_pz = pz_[self.first] + pz_[self.second]
+        m2 = sum_e * sum_e - (sum_px * sum_px + sum_py * sum_py + sum_pz * sum_pz)
+        self.mass = np.where(m2 < 0, -np.sqrt(np.abs(m2)), np.sqrt(np.abs(m2)))
+        self.pt = np.sqrt(sum_px * sum_px + sum_py * sum_py)
+        self.dr = kinematics.delta_r(eta.content[self.first], phi.content[self.first],
+                                     eta.content[self.second], phi.content[self.second])
+
+    @classmethod
+    def from_batch(cls, batch, collection="photon", scale=1.0):
+        # shared by all the analyses run on the same batch
+        return batch.cached(("PairTable", collection, scale), lambda: cls(
+            *(batch[collection + comp] for comp in ("E", "Px", "Py", "Pz")),
+            kinematics.column(batch, collection, "Eta"), kinematics.column(batch, collection, "Phi"),
+            scale=scale))
+
+    def __len__(self):
+        return len(self.first)
+
+    @property
+    def counts(self):
+        return np.diff(self.offsets)
+
+    def closest(self, mass):
+        """
+        Index of the first pair of every event with the smallest |M - mass|,
+        -1 for events with less than two photons.
+        """
+        distance = np.abs(self.mass - mass)
+        order = np.lexsort((np.arange(len(self)), distance, self.event))
+        best = np.full(len(self.offsets) - 1, -1, dtype=np.int64)
+        filled = self.counts > 0
+        best[filled] = order[self.offsets[:-1][filled]]
+        return best
+
+
+# largest number of photons of an event solved with the bitmask DP, branch
+# and bound above
+DP_MAX_PHOTONS = 12
+_DP_MAX_STATES = 1 << 22  # events x masks x pair counts of one DP batch
+
+
+def mass_window_pairs(table, mass, window, passed=None, max_pairs=None):
+    """
+    Pairs taken by the per-event pairing loop of the scripts, as a boolean
+    array over the pairs of table: the pairs are visited in order and taken when
+    both photons pass (boolean per photon), |M - mass| <= window, neither photon
+    is already the second photon of a taken pair and the event has fewer than
+    max_pairs[event] taken pairs (its gen pi0s).
+    mass, window and passed may have a leading axis of settings, all paired at
+    once; the result then has it too.
+    """
+    settings = max(np.ndim(mass), np.ndim(window), 0 if passed is None else np.ndim(passed) - 1)
+    mass, window = np.reshape(mass, (-1, 1)), np.reshape(window, (-1, 1))
+    passed = np.ones((1, table.n_photons), dtype=bool) if passed is None else np.atleast_2d(passed)
+    candidate = (passed[:, table.first] & passed[:, table.second] & (np.abs(table.mass[None, :] - mass) <= window))
+
+    n_settings, n_events = len(candidate), len(table.offsets) - 1
+    accepted = np.zeros(candidate.shape, dtype=bool)
+    used = np.zeros((n_settings, table.n_photons), dtype=bool)
+    n_taken = np.zeros((n_settings, n_events), dtype=np.int64)
+    # step k takes or not the k-th pair of every event
+    position = np.arange(len(table)) - table.offsets[table.event]
+    steps = np.argsort(position, kind="stable")
+    step_start = np.searchsorted(position[steps], np.arange(position.max() + 2 if len(position) else 1))
+    for k in range(len(step_start) - 1):
+        at = steps[step_start[k]:step_start[k + 1]]
+        first, second, event = table.first[at], table.second[at], table.event[at]
+        take = candidate[:, at] & ~used[:, first] & ~used[:, second]
+        if max_pairs is not None:
+            take &= n_taken[:, event] < max_pairs[event]
+        accepted[:, at] = take
+        setting, pair = np.nonzero(take)
+        used[setting, second[pair]] = True
+        n_taken[setting, event[pair]] += 1
+    return accepted if settings else accepted[0]
+
+
+def best_disjoint(table, mass, sigma, chi2_cut=9.0, max_pairs=None):
+    """
+    Best set of disjoint pairs of every event (pi0 candidates): among the pairs
+    with chi2 = ((M - mass) / sigma)^2 below chi2_cut, as many disjoint pairs as
+    possible (at most max_pairs, an int or one value per event), and of those
+    the set with the smallest total chi2. Returns the selected pair indices of
+    every event as a Jagged array, in pair order.
+    """
+    n_events = len(table.offsets) - 1
+    chi2 = ((table.mass - mass) / sigma) ** 2
+    allowed = chi2 < chi2_cut
+    if max_pairs is None:
+        max_pairs = np.full(n_events, np.iinfo(np.int64).max)
+    max_pairs = np.broadcast_to(np.asarray(max_pairs, dtype=np.int64), (n_events,))
+    # every extra pair is worth more than any total chi2, so the count comes first
+    reward = chi2_cut * (len(table) + 1)
+    selected = np.zeros(len(table), dtype=bool)
+
+    # photons of the allowed pairs, numbered from 0 in each event
+    members = np.concatenate((table.first[allowed], table.second[allowed]))
+    photons, local = np.unique(members, return_inverse=True)
+    pair_event = table.event[allowed]
+    photon_event = np.concatenate((pair_event, pair_event))
+    first_photon = np.full(n_events, len(photons), dtype=np.int64)
+    np.minimum.at(first_photon, photon_event, local)
+    local = local - first_photon[photon_event]
+    n_photons = np.zeros(n_events, dtype=np.int64)
+    np.maximum.at(n_photons, photon_event, local + 1)
+
+    pair_index = np.flatnonzero(allowed)
+    pair_i, pair_j = np.split(local, 2)
+    n_pairs = np.minimum(max_pairs, n_photons // 2)
+    pair_start = np.concatenate(([0], np.cumsum(np.bincount(pair_event, minlength=n_events))))
+
+    for n in np.unique(n_photons[n_photons >= 2]):
+        for k in np.unique(n_pairs[(n_photons == n) & (n_pairs > 0)]):
+            events = np.flatnonzero((n_photons == n) & (n_pairs == k))
+            counts = pair_start[events + 1] - pair_start[events]
+            rows = np.repeat(np.arange(len(events)), counts)
+            pairs = np.repeat(pair_start[events] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            cost = np.full((len(events), n, n), np.inf)
+            cost[rows, pair_i[pairs], pair_j[pairs]] = chi2[pair_index[pairs]] - reward
+            if n <= DP_MAX_PHOTONS:
+                step = max(1, _DP_MAX_STATES // ((1 << n) * (k + 1)))
+                chosen = np.concatenate([_dp(cost[s:s + step], k) for s in range(0, len(events), step)])
+            else:
+                chosen = np.array([_branch_and_bound(c, k) for c in cost])
+            # back to the pair indices of the table
+            by_photons = np.full((len(events), n, n), -1, dtype=np.int64)
+            by_photons[rows, pair_i[pairs], pair_j[pairs]] = pair_index[pairs]
+            ev, i, j = np.nonzero(chosen)
+            selected[by_photons[ev, i, j]] = True
+    return Jagged(table.offsets, np.arange(len(table))).select(selected)
+
+
+def _lowest_unset(masks):
+    bit = ~masks & (masks + 1)
+    return np.log2(bit).astype(np.int64)
+
+
+def _dp(cost, max_pairs):
+    """
+    Bitmask DP for a batch of events with the same number n of photons: the
+    photons are decided in order, the lowest undecided one is either left alone
+    or paired with a later one. best[mask, k] is the smallest cost of deciding
+    the photons not in mask when k pairs are already made. Returns the chosen
+    (i, j) as a boolean array (events, n, n).
+    """
+    n_events, n, _ = cost.shape
+    full = (1 << n) - 1
+    masks = np.arange(full + 1)
+    popcount = np.array([bin(mask).count("1") for mask in masks])
+    best = np.full((n_events, full + 1, max_pairs + 1), np.inf)
+    best[:, full, :] = 0.0
+    for count in range(n - 1, -1, -1):
+        layer = masks[popcount == count]
+        i = _lowest_unset(layer)
+        after_i = layer | (1 << i)
+        value = best[:, after_i, :].copy()
+        for j in range(1, n):
+            free = (j > i) & (layer & (1 << j) == 0)
+            if not free.any():
+                continue
+            source, target = layer[free], after_i[free] | (1 << j)
+            pair_value = cost[:, i[free], j][:, :, None] + best[:, target, 1:]
+            value[:, free, :max_pairs] = np.minimum(value[:, free, :max_pairs], pair_value)
+        best[:, layer, :] = value
+
+    # walk down from the empty mask following the optimal choices
+    chosen = np.zeros((n_events, n, n), dtype=bool)
+    rows = np.arange(n_events)
+    mask = np.zeros(n_events, dtype=np.int64)
+    made = np.zeros(n_events, dtype=np.int64)
+    for _ in range(n):
+        todo = mask != full
+        if not todo.any():
+            break
+        r, m, k = rows[todo], mask[todo], made[todo]
+        i = _lowest_unset(m)
+        target = best[r, m, k]
+        next_mask = m | (1 << i)
+        next_made = k.copy()
+        decided = best[r, next_mask, k] == target
+        for j in range(1, n):
+            free = ~decided & (j > i) & (m & (1 << j) == 0) & (k < max_pairs)
+            if not free.any():
+                continue
+            after = m[free] | (1 << i[free]) | (1 << j)
+            take = np.zeros(len(r), dtype=bool)
+            take[free] = (cost[r[free], i[free], j] + best[r[free], after, k[free] + 1] == target[free])
+            chosen[r[take], i[take], j] = True
+            next_mask[take] = m[take] | (1 << i[take]) | (1 << j)
+            next_made[take] = k[take] + 1
+            decided |= take
+        mask[todo], made[todo] = next_mask, next_made
+    return chosen
+
+
+def _branch_and_bound(cost, max_pairs):
+    """
+    Same answer as _dp for one event with many photons: depth-first over the
+    lowest undecided photon, pruning branches that cannot beat the best total
+    even if every remaining photon found its cheapest partner.
+    """
+    n = len(cost)
+    cheapest = np.minimum(np.min(cost, axis=1), np.min(cost, axis=0))
+
+    # start from the greedy answer (cheapest pairs first) to prune early
+    best_total = [0.0, []]
+    used = np.zeros(n, dtype=bool)
+    for flat in np.argsort(cost, axis=None):
+        i, j = divmod(int(flat), n)
+        if len(best_total[1]) == max_pairs or not np.isfinite(cost[i, j]):
+            break
+        if not used[i] and not used[j]:
+            used[i] = used[j] = True
+            best_total[0] += cost[i, j]
+            best_total[1].append((i, j))
+
+    def search(decided, made, total, pairs):
+        if total < best_total[0]:
+            best_total[0], best_total[1] = total, list(pairs)
+        free = [p for p in range(n) if not decided[p]]
+        if len(free) < 2 or made == max_pairs:
+            return
+        # at most one pair per two free photons, each at its cheapest
+        bound = np.sort(np.minimum(cheapest[free], 0.0))[:min(max_pairs - made, len(free) // 2) * 2].sum() / 2
+        if total + bound >= best_total[0]:
+            return
+        i, rest = free[0], free[1:]
+        decided[i] = True
+        for j in sorted(rest, key=lambda p: cost[i, p]):
+            if np.isfinite(cost[i, j]):
+                decided[j] = True
+                pairs.append((i, j))
+                search(decided, made + 1, total + cost[i, j], pairs)
+                pairs.pop()
+                decided[j] = False
+        search(decided, made, total, pairs)
+        decided[i] = False
+
+    search(np.zeros(n, dtype=bool), 0, 0.0, [])
+    chosen = np.zeros((n, n), dtype=bool)
+    for i, j in best_total[1]:
+        chosen[i, j] = True
+    return chosen
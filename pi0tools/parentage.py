@@ -0,0 +1,28 @@
+"""
+Gen photon pairs from the pi0 -> gamma gamma parentage written by the producer
+(genPhotonPi0Index, genPi0Photon1Index, genPi0Photon2Index).
+
+With it the analyses take the two photons of each gen pi0 directly instead of
+pairing the gen photons by invariant mass, which is quadratic in the number of
+photons and ambiguous when an event has several pi0s. Older files do not have
+the branches; the scripts keep the mass-window pairing for them.
+"""
+import numpy as np
+
+BRANCHES = ["genPhotonPi0Index", "genPi0Photon1Index", "genPi0Photon2Index"]
+
+
+def available(batch):
+    return all(name in batch for name in BRANCHES)
+
+
+def photon_pairs(batch):
+    """
+    Flat genPhoton indices (first, second) of the two photons of every gen pi0
+    that has both of them among the gen photons, in event order.
+    """
+    first = batch["genPi0Photon1Index"]
+    second = batch["genPi0Photon2Index"]
+    both = (first.content >= 0) & (second.content >= 0)
+    start = batch["genPhotonE"].offsets[first.event_index]
+    return (start + first.content)[both].astype(np.int64), (start + second.content)[both].astype(np.int64)
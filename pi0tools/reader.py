@@ -0,0 +1,138 @@
+"""
+Chunked, columnar reader for the "outtree" written by miniTreeForAnneMarie.py.
+
+Instead of binding std::vector<double> proxies with SetBranchAddress and calling
+GetEntry once per event, the branches are decoded N events at a time. Vector
+branches (photonE, genPhotonPx, ...) come back as Jagged offset+content arrays
+and scalar branches (nPhotons, beamE, ...) as plain numpy arrays.
+
+    for batch in reader.iterate("miniTree.root", reader.vector_branches("photon", "genPhoton")):
+        pho_e = batch["photonE"]        # Jagged
+        for i_event in range(len(batch)):
+            pho_e[i_event]              # numpy view of the photon energies of one event
+"""
+import contextlib
+
+import awkward as ak
+import uproot
+
+from pi0tools import colcache
+from pi0tools.jagged import Jagged
+
+TREE_NAME = "outtree"
+DEFAULT_STEP = 100000
+
+# Same layout as the producer
+COLLECTIONS = ["photon", "genPhoton", "genPi0"]
+COMPONENTS = ["P", "E", "Px", "Py", "Pz", "M"]
+# written only when the producer runs with --angles
+ANGLES = ["Theta", "Phi", "Eta"]
+SCALARS = ["beamE", "nPhotons", "nGenPhotons", "nGenPi0s", "nGenTaus", "nRecoTausHad"]
+
+
+def vector_branches(*collections, components=("E", "Px", "Py", "Pz")):
+    return [coll + comp for coll in collections for comp in components]
+
+
+class Batch:
+    """A chunk of consecutive events [entry_start, entry_stop) of the tree."""
+
+    def __init__(self, columns, entry_start, entry_stop):
+        self.columns = columns
+        self.entry_start = entry_start
+        self.entry_stop = entry_stop
+        self.derived = {}
+
+    def __len__(self):
+        return self.entry_stop - self.entry_start
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __setitem__(self, name, value):
+        # derived columns (theta, match indices, ...) can be attached to the batch
+        self.columns[name] = value
+
+    def cached(self, key, compute):
+        # other derived objects (e.g. a Delta R matrix), computed once per batch
+        if key not in self.derived:
+            self.derived[key] = compute()
+        return self.derived[key]
+
+    def event(self, i, *names):
+        # per-event views of the requested columns, in the order given
+        return tuple(self.columns[name][i] for name in names)
+
+
+def _to_column(array):
+    if array.ndim == 1:
+        return ak.to_numpy(array)
+    return Jagged.from_counts(ak.to_numpy(ak.num(array)), ak.to_numpy(ak.flatten(array)))
+
+
+def _chunks(tree, columns_cache, branches, step_size, entry_start, entry_stop):
+    # (columns, entry_start, entry_stop) of every chunk, from the ROOT tree or the column cache
+    if columns_cache is None:
+        for arrays, report in tree.iterate(branches, step_size=step_size, library="ak",
+                                           entry_start=entry_start, entry_stop=entry_stop,
+                                           report=True):
+            yield ({name: _to_column(arrays[name]) for name in branches},
+                   report.tree_entry_start, report.tree_entry_stop)
+        return
+    entry_start = 0 if entry_start is None else entry_start
+    entry_stop = columns_cache.num_entries if entry_stop is None else min(entry_stop, columns_cache.num_entries)
+    for start in range(entry_start, entry_stop, step_size):
+        stop = min(start + step_size, entry_stop)
+        columns = {}
+        for name in branches:
+            column = columns_cache.column(name, start, stop)
+            columns[name] = Jagged(*column) if isinstance(column, tuple) else column
+        yield columns, start, stop
+
+
+def iterate(filename, branches=None, step_size=DEFAULT_STEP, treename=TREE_NAME,
+            entry_start=None, entry_stop=None, optional=(), friends=(), use_cache=True):
+    """
+    Yield Batch objects of at most step_size events. The optional branches are
+    read too when the tree has them (e.g. the stored ANGLES), or else when one
+    of the friend trees, given as (filename, treename) with the same entries,
+    has them (e.g. the match table of pi0tools/matchtable.py). The tree is read
+    from its column cache (pi0tools/colcache.py) when it has one with all the
+    branches.
+    """
+    with contextlib.ExitStack() as stack:
+        tree = None
+        columns_cache = colcache.load(filename, treename) if use_cache else None
+        if columns_cache is not None and branches is not None and not all(name in columns_cache for name in branches):
+            columns_cache = None
+        if columns_cache is None:
+            tree = stack.enter_context(uproot.open(filename))[treename]
+            keys = tree.keys()
+        else:
+            keys = columns_cache.keys()
+        if branches is None:
+            branches = keys
+        branches = list(branches) + [name for name in optional if name in keys and name not in branches]
+        friend_branches = []
+        for friend_file, friend_tree in friends:
+            friend = stack.enter_context(uproot.open(friend_file))[friend_tree]
+            names = [name for name in optional if name in friend and name not in branches
+                     and all(name not in names_ for _, names_ in friend_branches)]
+            if names:
+                friend_branches.append((friend, names))
+        for columns, start, stop in _chunks(tree, columns_cache, branches, step_size, entry_start, entry_stop):
+            for friend, names in friend_branches:
+                friend_arrays = friend.arrays(names, entry_start=start, entry_stop=stop, library="ak")
+                columns.update((name, _to_column(friend_arrays[name])) for name in names)
+            yield Batch(columns, start, stop)
+
+
+def num_entries(filename, treename=TREE_NAME):
+    columns_cache = colcache.load(filename, treename)
+    if columns_cache is not None:
+        return columns_cache.num_entries
+    with uproot.open(filename) as infile:
+        return infile[treename].num_entries
@@ -0,0 +1,144 @@
+"""
+Per-event reference implementations of the batched kernels: the loops of the
+original scripts, with TLorentzVector and one Fill per value, returning the
+same arrays as the fast paths they stand for
+    nearest        matching.nearest (match_energy.py, dr_scan.py)
+    greedy_match   matching.greedy_match (min_dr_threshold.py)
+    match_pairs    matching.match_pairs / matchtable.match_pairs (eratio.py, n_reco.py, ...)
+    closest_pairs  pairs.PairTable.closest (invariant_mass.py)
+    mass_window_pairs  pairs.mass_window_pairs (eratio.py, n_reco.py, match_energy_genpair.py, cut_grid.py)
+    fill           hists.fill
+They are slow and only used by benchmark.py --check, which compares the
+histograms of both on the same chunks.
+"""
+from itertools import combinations
+
+import numpy as np
+import ROOT
+
+
+def photons(batch, i_event, collection, scale=1.0):
+    """TLorentzVectors of the photons of one event of a batch."""
+    e, px, py, pz = batch.event(i_event, *(collection + comp for comp in ("E", "Px", "Py", "Pz")))
+    return [ROOT.TLorentzVector(px[j] * scale, py[j] * scale, pz[j] * scale, e[j] * scale) for j in range(len(e))]
+
+
+def nearest(batch, targets="genPhoton", candidates="photon"):
+    """Flat index of the closest candidate of every target (-1 if none) and its Delta R."""
+    target_offsets, cand_offsets = batch[targets + "E"].offsets, batch[candidates + "E"].offsets
+    index = np.full(target_offsets[-1], -1, dtype=np.int64)
+    min_dr = np.full(target_offsets[-1], np.inf)
+    for i_event in range(len(batch)):
+        cand_photons = photons(batch, i_event, candidates)
+        for i, target in enumerate(photons(batch, i_event, targets), target_offsets[i_event]):
+            for j, cand in enumerate(cand_photons, cand_offsets[i_event]):
+                dr = target.DeltaR(cand)
+                if dr < min_dr[i]:
+                    min_dr[i] = dr
+                    index[i] = j
+    return index, min_dr
+
+
+def greedy_match(batch, targets="genPhoton", candidates="photon", cut=None, target_mask=None, cand_mask=None,
+                 skip_used=True):
+    """
+    One-to-one matching, the targets of an event in order: the flat index of the
+    matched candidate of every target (-1 if none) and the Delta R to its
+    nearest available candidate. Arguments as for matching.greedy_match.
+    """
+    target_offsets, cand_offsets = batch[targets + "E"].offsets, batch[candidates + "E"].offsets
+    match = np.full(target_offsets[-1], -1, dtype=np.int64)
+    match_dr = np.full(target_offsets[-1], np.inf)
+    for i_event in range(len(batch)):
+        cand_photons = photons(batch, i_event, candidates)
+        used = set()
+        for i, target in enumerate(photons(batch, i_event, targets), target_offsets[i_event]):
+            if target_mask is not None and not target_mask[i]:
+                continue
+            best = -1
+            for j, cand in enumerate(cand_photons, cand_offsets[i_event]):
+                if (cand_mask is not None and not cand_mask[j]) or (skip_used and j in used):
+                    continue
+                dr = target.DeltaR(cand)
+                if dr < match_dr[i]:
+                    match_dr[i] = dr
+                    best = j
+            if best < 0 or (cut is not None and match_dr[i] >= cut) or best in used:
+                continue
+            match[i] = best
+            used.add(best)
+    return match, match_dr
+
+
+def match_pairs(batch, first, second, cut, targets="genPhoton", candidates="photon"):
+    """Greedy matching of both photons of each pair, a candidate used once per pair: (nPairs, 2) indices."""
+    target_offsets, cand_offsets = batch[targets + "E"].offsets, batch[candidates + "E"].offsets
+    event = np.searchsorted(target_offsets, first, side="right") - 1
+    match = np.full((len(first), 2), -1, dtype=np.int64)
+    event_photons = {}
+    for i_pair, i_event in enumerate(event):
+        if i_event not in event_photons:
+            event_photons = {i_event: (photons(batch, i_event, targets), photons(batch, i_event, candidates))}
+        target_photons, cand_photons = event_photons[i_event]
+        used = set()
+        for k, i in enumerate((first[i_pair], second[i_pair])):
+            target = target_photons[i - target_offsets[i_event]]
+            best_dr, best = np.inf, -1
+            for j, cand in enumerate(cand_photons, cand_offsets[i_event]):
+                if j in used:
+                    continue
+                dr = cand.DeltaR(target)
+                if dr < best_dr:
+                    best_dr, best = dr, j
+            if best >= 0 and best_dr < cut:
+                match[i_pair, k] = best
+                used.add(best)
+    return match
+
+
+def closest_pairs(batch, mass, collection="photon", scale=1.0):
+    """Mass and Delta R of the pair closest to mass in every event with two photons or more (NaN otherwise)."""
+    pair_mass, pair_dr = np.full(len(batch), np.nan), np.full(len(batch), np.nan)
+    for i_event in range(len(batch)):
+        distance = np.inf
+        for a, b in combinations(photons(batch, i_event, collection, scale), 2):
+            m = (a + b).M()
+            if abs(m - mass) < distance:
+                distance = abs(m - mass)
+                pair_mass[i_event], pair_dr[i_event] = m, a.DeltaR(b)
+    return pair_mass, pair_dr
+
+
+def mass_window_pairs(batch, mass, window, passed=None, max_pairs=None, collection="genPhoton"):
+    """Flat indices of the first and second photons of the pairs taken by the pairing loop of the scripts."""
+    offsets = batch[collection + "E"].offsets
+    pair_first, pair_second = [], []
+    for i_event in range(len(batch)):
+        event_photons = photons(batch, i_event, collection)
+        start = offsets[i_event]
+        used = set()
+        n_taken = 0
+        for i in range(len(event_photons)):
+            if i in used or (passed is not None and not passed[start + i]):
+                continue
+            for j in range(i + 1, len(event_photons)):
+                if j in used or (passed is not None and not passed[start + j]):
+                    continue
+                if abs((event_photons[i] + event_photons[j]).M() - mass) > window:
+                    continue
+                if max_pairs is not None and n_taken >= max_pairs[i_event]:
+                    continue  # no gen pi0 left
+                n_taken += 1
+                used.update([i, j])
+                pair_first.append(start + i)
+                pair_second.append(start + j)
+    return np.array(pair_first, dtype=np.int64), np.array(pair_second, dtype=np.int64)
+
+
+def fill(hist, x, y=None):
+    """hists.fill, one value at a time."""
+    for i in range(len(x)):
+        if y is None:
+            hist.Fill(x[i])
+        else:
+            hist.Fill(x[i], y[i])
@@ -0,0 +1,159 @@
+"""
+Per-file results of the analyses, cached so that a growing dataset is only
+processed for its new files (run_dataset.py).
+
+The result of an analysis on one file is what its process() accumulated over
+that file: the histograms booked at module level, added with TH1.Add, and the
+module attributes listed in its `accumulators`, each with a merge rule
+    "sum"      counters and numpy count arrays, added
+    "concat"   lists, concatenated in the order of the files
+    "min"/"max"
+    "last"     the value of the last file whose process() set it
+    "events"   list of column dicts whose "event" is an entry of the file:
+               concatenated, numbered across the files as in their hadd
+Merging the results of the files in order gives the module the state it has
+after a single loop over all of them, on which finish() and plot() run.
+
+A result is pickled in <cache>/<key>.pkl, the key being the SHA-1 of the
+content of the input file, the analysis, the SHA-1 of its script and of
+pi0tools/, its settings (cell_size, matching_mode) and, for the analyses with
+start(), the theta range of the whole dataset, which their cuts use: a new
+file that widens it invalidates their results. The content hashes of the
+input files are kept in <cache>/hashes.json, by size and modification time.
+"""
+import glob
+import hashlib
+import json
+import os
+import pickle
+
+from pi0tools import acceptance, colcache, driver
+
+VERSION = 1
+HASHES = "hashes.json"
+LISTS = ("concat", "events")
+MERGE = {"sum": lambda merged, value: merged + value, "min": min, "max": max,
+         "last": lambda merged, value: value}
+
+_code_hashes = {}
+
+
+def code_hash(analysis):
+    """SHA-1 of the script of an analysis and of pi0tools/."""
+    path = os.path.abspath(analysis.__file__)
+    if path not in _code_hashes:
+        digest = hashlib.sha1()
+        package = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py")))
+        for filename in [path] + package:
+            with open(filename, "rb") as source:
+                digest.update(source.read())
+        _code_hashes[path] = digest.hexdigest()
+    return _code_hashes[path]
+
+
+def snapshot(analysis):
+    """The accumulators of a freshly loaded analysis, for capture()."""
+    return {name: getattr(analysis, name) for name in getattr(analysis, "accumulators", {})}
+
+
+def capture(analysis, initial, n_events):
+    """The result of an analysis after its loop over one file of n_events events."""
+    state = {}
+    for name, rule in getattr(analysis, "accumulators", {}).items():
+        value = getattr(analysis, name)
+        if rule != "last" or value is not initial[name]:  # "last": only if process() rebound it
+            state[name] = value
+    return {"entries": n_events, "histograms": driver.histograms(analysis), "state": state}
+
+
+def merge(analysis, results):
+    """Puts the merged results of the files, in order, into a freshly loaded analysis module."""
+    rules = getattr(analysis, "accumulators", {})
+    merged_hists, state, offset = {}, {}, 0
+    for result in results:
+        for name, hist in result["histograms"].items():
+            if name in merged_hists:
+                merged_hists[name].Add(hist)
+            else:
+                merged_hists[name] = hist.Clone()
+                merged_hists[name].SetDirectory(0)
+        for name, value in result["state"].items():
+            rule = rules[name]
+            if rule == "events":
+                value = [dict(chunk, event=chunk["event"] + offset) for chunk in value]
+            if name not in state:
+                state[name] = list(value) if rule in LISTS else value
+            elif rule in LISTS:
+                state[name].extend(value)
+            else:
+                state[name] = MERGE[rule](state[name], value)
+        offset += result["entries"]
+    for name, attribute, key, hist in list(driver._slots(analysis)):
+        if name not in merged_hists:
+            continue
+        if key is None:
+            setattr(analysis, attribute, merged_hists[name])
+        else:
+            getattr(analysis, attribute)[key] = merged_hists[name]
+    for name, value in state.items():
+        setattr(analysis, name, value)
+
+
+class ResultCache:
+    """The per-file results in a directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(os.path.join(directory, HASHES)) as hashes:
+                self.hashes = json.load(hashes)
+        except (OSError, ValueError):
+            self.hashes = {}
+
+    def content_hash(self, filename):
+        """SHA-1 of an input file, recomputed when its size or modification time changed."""
+        name = os.path.abspath(filename)
+        source = acceptance.file_key(filename)
+        known = self.hashes.get(name)
+        if known is None or known["source"] != source:
+            self.hashes[name] = {"source": source, "sha1": colcache.file_hash(filename)}
+        return self.hashes[name]["sha1"]
+
+    def save_hashes(self):
+        self._write(HASHES, json.dumps(self.hashes, indent=1).encode())
+
+    def key(self, name, analysis, filename, dataset):
+        """Key of the result of an analysis (already set up) on one of the files of dataset."""
+        photon_acceptance = acceptance.read(dataset)
+        key = {
+            "version": VERSION,
+            "analysis": name,
+            "code": code_hash(analysis),
+            "input": self.content_hash(filename),
+            "settings": {setting: getattr(analysis, setting) for setting in driver.SETTINGS if hasattr(analysis, setting)},
+            "theta": ([photon_acceptance["thetaMin"], photon_acceptance["thetaMax"]]
+                      if hasattr(analysis, "start") else None),
+        }
+        return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pkl")
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def load(self, key):
+        with open(self._path(key), "rb") as infile:
+            return pickle.load(infile)
+
+    def store(self, key, result):
+        self._write(key + ".pkl", pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def _write(self, name, data):
+        # through a temporary file, several workers write to the cache
+        path = os.path.join(self.directory, name)
+        temporary = "{}.{}.tmp".format(path, os.getpid())
+        with open(temporary, "wb") as outfile:
+            outfile.write(data)
+        os.replace(temporary, path)
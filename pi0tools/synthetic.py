@@ -0,0 +1,205 @@
+"""
+Synthetic events with the content of the outtree, for scaling and stress
+tests without the edm4hep inputs.
+
+A toy of Z -> tau tau at the Z pole: the gen pi0s and the other gen photons
+are emitted around the axis of the two taus, each pi0 decays isotropically to
+two photons, and the gen photons are kept above the producer's 0.1 GeV cut.
+The reco photons are the gen photons inside the ECAL theta range, detected
+with an energy turn-on, smeared by the Si-W energy resolution and by the cell
+size in angle, merged into one photon when two of them are closer than the
+cell size can resolve (the min_delta_r of n_reco.py), plus a few soft fakes,
+again above 0.1 GeV. The mean multiplicities and the fraction of gen photons
+coming from pi0s are parameters; the defaults are close to miniTree.root.
+
+generate() returns the columns of a chunk of events as the producer fills
+them: Jagged vectors (genPhotonPi0Index and genPi0Photon1Index/2Index
+included, photonM holding Pz as in the producer) and numpy scalars.
+"""
+import numpy as np
+
+from pi0tools import edm, kinematics
+from pi0tools.jagged import Jagged
+from pi0tools.pairs import PairTable
+
+BEAM_E = 45.5991  # GeV
+PI0_MASS = 0.1349768  # GeV
+E_MIN = 0.1  # GeV, gen and reco photon selections of the producer
+THETA_MIN = 0.143  # rad, reco photon theta range (and pi - THETA_MIN)
+R_IN = 2.15  # m, inner ECAL radius
+# sigma_E / E = STOCHASTIC / sqrt(E) (+) CONSTANT of the Si-W ECAL
+STOCHASTIC, CONSTANT = 0.17, 0.01
+# reco efficiency 1 / (1 + exp(-(E - TURN_ON) / TURN_ON_WIDTH))
+TURN_ON, TURN_ON_WIDTH = 0.2, 0.05  # GeV
+# angular spread of the tau decay products around the tau direction [rad]
+PI0_SPREAD, PHOTON_SPREAD, FAKE_SPREAD = 0.15, 0.3, 0.5
+
+# defaults: mean gen photons per event before the 0.1 GeV cut, their fraction from
+# pi0 decays, mean fake reco photons per event
+PHOTONS = 2.9
+PI0_FRACTION = 0.95
+FAKES = 0.4
+
+
+def min_delta_r(cell_size, radius=R_IN):
+    # smallest Delta R at which two showers are still separated (as n_reco.py)
+    return np.sqrt((cell_size * 3 / radius) ** 2 + (0.5 * cell_size * 3 / radius) ** 2)
+
+
+def _around(rng, axis, spread):
+    # unit vectors scattered around each axis (rows) by a gaussian angle of width spread
+    helper = np.where(np.abs(axis[:, 2:3]) < 0.9, [[0.0, 0.0, 1.0]], [[1.0, 0.0, 0.0]])
+    u = np.cross(axis, helper)
+    u /= np.linalg.norm(u, axis=1, keepdims=True)
+    v = np.cross(axis, u)
+    offset = rng.normal(0.0, spread, (len(axis), 2))
+    direction = axis + offset[:, :1] * u + offset[:, 1:] * v
+    return direction / np.linalg.norm(direction, axis=1, keepdims=True)
+
+
+def _isotropic(rng, n):
+    cos_theta = rng.uniform(-1.0, 1.0, n)
+    phi = rng.uniform(-np.pi, np.pi, n)
+    sin_theta = np.sqrt(1.0 - cos_theta * cos_theta)
+    return np.column_stack((sin_theta * np.cos(phi), sin_theta * np.sin(phi), cos_theta))
+
+
+def _boost(e, p, beta):
+    # four-vectors (e, p) of the rest frame boosted by the velocity beta (rows)
+    beta2 = np.sum(beta * beta, axis=1)
+    gamma = 1.0 / np.sqrt(1.0 - beta2)
+    bp = np.sum(beta * p, axis=1)
+    factor = np.where(beta2 > 0, (gamma - 1.0) * bp / np.where(beta2 > 0, beta2, 1.0), 0.0)
+    return gamma * (e + bp), p + (factor + gamma * e)[:, None] * beta
+
+
+def _along_taus(rng, tau_axis, event):
+    # each particle goes along one of the two (back to back) taus of its event
+    return tau_axis[event] * rng.choice([-1.0, 1.0], len(event))[:, None]
+
+
+def _jagged(event, n_events, values):
+    # per-particle values (already ordered by event) as a Jagged array
+    return Jagged.from_counts(np.bincount(event, minlength=n_events), values)
+
+
+def _four_vector_columns(event, n_events, e, p):
+    columns = {"E": e, "Px": p[:, 0], "Py": p[:, 1], "Pz": p[:, 2], "P": np.linalg.norm(p, axis=1)}
+    return {comp: _jagged(event, n_events, values) for comp, values in columns.items()}
+
+
+def _merge_close(event, e, p, cell_size):
+    """
+    Showers closer than min_delta_r(cell_size) in the same event, merged into
+    one (four-momenta added, chains of close showers included).
+    """
+    counts = np.bincount(event, minlength=event[-1] + 1 if len(event) else 0)
+    px, py, pz = p[:, 0], p[:, 1], p[:, 2]
+    showers = Jagged.from_counts(counts, e)
+    table = PairTable(showers, *(showers.with_content(c) for c in (px, py, pz)),
+                      showers.with_content(kinematics.eta(px, py, pz)), showers.with_content(kinematics.phi(px, py, pz)))
+    close = table.dr < min_delta_r(cell_size)
+    first, second = table.first[close], table.second[close]
+    label = np.arange(len(e))
+    while True:
+        lowest = np.minimum(label[first], label[second])
+        new_label = label.copy()
+        np.minimum.at(new_label, first, lowest)
+        np.minimum.at(new_label, second, lowest)
+        new_label = new_label[new_label]
+        if np.array_equal(new_label, label):
+            break
+        label = new_label
+    keep = label == np.arange(len(e))
+    merged_e = np.zeros(len(e))
+    merged_p = np.zeros(p.shape)
+    np.add.at(merged_e, label, e)
+    np.add.at(merged_p, label, p)
+    return event[keep], merged_e[keep], merged_p[keep]
+
+
+def generate(n_events, rng, photons=PHOTONS, pi0_fraction=PI0_FRACTION, fakes=FAKES, cell_size=0.005):
+    """Columns of n_events synthetic events, as the producer writes them (without the angles)."""
+    tau_axis = _isotropic(rng, n_events)
+
+    # gen pi0s, along the taus, with a falling energy spectrum
+    n_pi0 = rng.poisson(photons * pi0_fraction / 2, n_events)
+    pi0_event = np.repeat(np.arange(n_events), n_pi0)
+    pi0_e = np.maximum(BEAM_E * rng.beta(1.0, 3.0, len(pi0_event)), PI0_MASS * 1.001)
+    pi0_dir = _around(rng, _along_taus(rng, tau_axis, pi0_event), PI0_SPREAD)
+    pi0_p = pi0_dir * np.sqrt(pi0_e * pi0_e - PI0_MASS * PI0_MASS)[:, None]
+
+    # pi0 -> gamma gamma, back to back in the pi0 rest frame
+    rest_dir = _isotropic(rng, len(pi0_event))
+    beta = pi0_p / pi0_e[:, None]
+    half = np.full(len(pi0_event), PI0_MASS / 2)
+    e1, p1 = _boost(half, rest_dir * half[:, None], beta)
+    e2, p2 = _boost(half, -rest_dir * half[:, None], beta)
+
+    # other gen photons (radiation, other decays)
+    n_other = rng.poisson(photons * (1 - pi0_fraction), n_events)
+    other_event = np.repeat(np.arange(n_events), n_other)
+    other_e = E_MIN / 2 + rng.exponential(2.0, len(other_event))
+    other_p = _around(rng, _along_taus(rng, tau_axis, other_event), PHOTON_SPREAD) * other_e[:, None]
+
+    # gen photons of an event: the two photons of each pi0 in turn, then the others
+    n_decay = 2 * len(pi0_event)
+    gen_event = np.concatenate((np.repeat(pi0_event, 2), other_event))
+    gen_e = np.concatenate((np.column_stack((e1, e2)).ravel(), other_e))
+    gen_p = np.concatenate((np.stack((p1, p2), axis=1).reshape(-1, 3), other_p))
+    gen_pi0 = np.concatenate((np.repeat(np.arange(len(pi0_event)), 2), np.full(len(other_event), -1)))
+    order = np.argsort(gen_event, kind="stable")
+    gen_event, gen_e, gen_p, gen_pi0 = gen_event[order], gen_e[order], gen_p[order], gen_pi0[order]
+    kept = gen_e > E_MIN
+    gen_event, gen_e, gen_p, gen_pi0 = gen_event[kept], gen_e[kept], gen_p[kept], gen_pi0[kept]
+
+    # parentage, as indices inside the events
+    gen_photon = _four_vector_columns(gen_event, n_events, gen_e, gen_p)
+    local = gen_photon["E"].local_index
+    pi0_offsets = Jagged.from_counts(n_pi0, pi0_e).offsets
+    photon_pi0 = np.where(gen_pi0 >= 0, gen_pi0 - pi0_offsets[gen_event], -1)
+    from_pi0 = np.flatnonzero(gen_pi0 >= 0)
+    daughters = edm.first_two(gen_pi0[from_pi0], local[from_pi0], len(pi0_event))
+    gen_photon["Pi0Index"] = gen_photon["E"].with_content(photon_pi0.astype(np.int32))
+    gen_photon["M"] = gen_photon["E"].with_content(np.zeros(len(gen_e)))
+
+    gen_pi0s = _four_vector_columns(pi0_event, n_events, pi0_e, pi0_p)
+    gen_pi0s["M"] = gen_pi0s["E"].with_content(np.full(len(pi0_e), PI0_MASS))
+    gen_pi0s["Photon1Index"] = gen_pi0s["E"].with_content(daughters[0].astype(np.int32))
+    gen_pi0s["Photon2Index"] = gen_pi0s["E"].with_content(daughters[1].astype(np.int32))
+
+    # reco showers: detected gen photons, smeared, plus soft fakes
+    theta = kinematics.theta(gen_p[:, 0], gen_p[:, 1], gen_p[:, 2])
+    efficiency = 1.0 / (1.0 + np.exp(-(gen_e - TURN_ON) / TURN_ON_WIDTH))
+    seen = (theta > THETA_MIN) & (theta < np.pi - THETA_MIN) & (rng.uniform(size=len(gen_e)) < efficiency)
+    resolution = np.sqrt(STOCHASTIC ** 2 / gen_e[seen] + CONSTANT ** 2)
+    shower_e = gen_e[seen] * np.maximum(1.0 + rng.normal(0.0, 1.0, len(resolution)) * resolution, 0.0)
+    shower_dir = _around(rng, gen_p[seen] / gen_e[seen][:, None], cell_size / np.sqrt(12) / R_IN)
+
+    n_fake = rng.poisson(fakes, n_events)
+    fake_event = np.repeat(np.arange(n_events), n_fake)
+    fake_e = E_MIN / 2 + rng.exponential(0.3, len(fake_event))
+    fake_dir = _around(rng, _along_taus(rng, tau_axis, fake_event), FAKE_SPREAD)
+
+    shower_event = np.concatenate((gen_event[seen], fake_event))
+    shower_e = np.concatenate((shower_e, fake_e))
+    shower_p = np.concatenate((shower_dir, fake_dir)) * shower_e[:, None]
+    order = np.argsort(shower_event, kind="stable")
+    reco_event, reco_e, reco_p = _merge_close(shower_event[order], shower_e[order], shower_p[order], cell_size)
+    reco_theta = kinematics.theta(reco_p[:, 0], reco_p[:, 1], reco_p[:, 2])
+    kept = (reco_e > E_MIN) & (reco_theta > THETA_MIN) & (reco_theta < np.pi - THETA_MIN)
+    # in each event the most energetic first
+    order = np.lexsort((-reco_e[kept], reco_event[kept]))
+    reco_event, reco_e, reco_p = reco_event[kept][order], reco_e[kept][order], reco_p[kept][order]
+    photon = _four_vector_columns(reco_event, n_events, reco_e, reco_p)
+    photon["M"] = photon["Pz"]  # as in the producer
+
+    columns = {"beamE": np.full(n_events, BEAM_E),
+               "nPhotons": photon["E"].counts.astype(np.float64),
+               "nGenPhotons": gen_photon["E"].counts.astype(np.float64),
+               "nGenPi0s": gen_pi0s["E"].counts.astype(np.float64),
+               "nGenTaus": np.full(n_events, 2.0),
+               "nRecoTausHad": np.full(n_events, -1.0)}
+    for name, collection in (("photon", photon), ("genPhoton", gen_photon), ("genPi0", gen_pi0s)):
+        columns.update((name + comp, values) for comp, values in collection.items())
+    return columns
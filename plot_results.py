@@ -0,0 +1,66 @@
+"""
+Makes the plots of the analyses from their saved histograms, as a step of its
+own after headless event loops (run_analyses.py --no-plots, sweep.py --plots
+none): every <analysis>/ directory of a histograms file (pi0tools/driver.py
+save()) is put back into a fresh copy of its script, whose plot() then draws
+and saves the PNGs in the output directory, as the script would have done at
+the end of its loop. For a sweep.root, with one directory per sample, the
+plots of every sample go to <outdir>/<sample>/.
+
+    python plot_results.py histograms.root
+    python plot_results.py sweep/sweep.root -o sweep -a nreco_vs_dr
+"""
+import argparse
+import os
+
+import ROOT
+import run_analyses
+from pi0tools import driver
+
+
+def plot_directory(directory, names=None):
+    # the plots of the analyses saved in directory, in the current directory
+    for key in directory.GetListOfKeys():
+        name = key.GetName()
+        if name not in run_analyses.ANALYSES or (names and name not in names):
+            continue
+        analysis = run_analyses.load(name)
+        driver.restore(analysis, directory.Get(name))
+        if hasattr(analysis, "plot"):
+            analysis.plot()
+
+
+def plot_file(filename, names=None, outdir="."):
+    filename, outdir = os.path.abspath(filename), os.path.abspath(outdir)
+    cwd = os.getcwd()
+    infile = ROOT.TFile(filename)
+    top = [key.GetName() for key in infile.GetListOfKeys()]
+    # histograms of one sample (<analysis>/...), or of a sweep (<sample>/<analysis>/...)
+    samples = [None] if any(name in run_analyses.ANALYSES for name in top) else top
+    try:
+        for sample in samples:
+            plot_dir = outdir if sample is None else os.path.join(outdir, sample)
+            os.makedirs(plot_dir, exist_ok=True)
+            os.chdir(plot_dir)  # the scripts save their plots in the current directory
+            plot_directory(infile if sample is None else infile.Get(sample), names)
+    finally:
+        os.chdir(cwd)
+        infile.Close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Make the plots of the analyses from their saved histograms",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="histograms.root or sweep.root files")
+    parser.add_argument("-a", "--analyses", nargs="+", choices=list(run_analyses.ANALYSES), default=None)
+    parser.add_argument("-o", "--outdir", default=".")
+    args = parser.parse_args()
+
+    ROOT.gROOT.SetBatch(True)
+    ROOT.TH1.AddDirectory(False)
+    for filename in args.inputs:
+        plot_file(filename, args.analyses, args.outdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Runs several of the analysis scripts on the same input file in a single pass:
+each chunk of events is read once and handed to every script, so the branches
+are decoded and the angles and Delta R matrix computed only once. Every script
+still makes its own histograms, PNGs and output files, as when run alone.
+
+--no-plots is for batch jobs: no canvas is made, the fits and output files
+are, and all the histograms are saved in histograms.root (--histograms), from
+which plot_results.py makes the PNGs later.
+
+    python run_analyses.py -i miniTree.root
+    python run_analyses.py -i miniTreeAM_modifEcal2.root -a energy_ratio nreco_vs_dr
+    python run_analyses.py -i miniTree.root --no-plots && python plot_results.py histograms.root
+"""
+import argparse
+import importlib.util
+import os
+
+import ROOT
+from pi0tools import driver, reader
+
+# name -> script, relative to this directory
+ANALYSES = {
+    "photon_match": "photon_match/min_dr_threshold.py",
+    "dr_scan": "photon_match/dr_scan.py",
+    "E_threshold": "E_threhsold/match_energy.py",
+    "E_threshold_genpair": "E_threhsold/match_energy_genpair.py",
+    "energy_ratio": "energy_ratio/eratio.py",
+    "nreco_vs_dr": "nReco vs. gen delta R/n_reco.py",
+    "pi0_mass": "pi0 mass/invariant_mass.py",
+}
+
+
+def load(name):
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ANALYSES[name])
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run several analyses in one pass over a miniTree",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-i", "--input", default="miniTree.root")
+    parser.add_argument("-a", "--analyses", nargs="+", choices=list(ANALYSES), default=list(ANALYSES))
+    parser.add_argument("--step-size", type=int, default=reader.DEFAULT_STEP, help="events per chunk")
+    parser.add_argument("--matching", choices=["greedy", "optimal"], default=None,
+                        help="reco/gen matching (default: the one of each script, greedy)")
+    parser.add_argument("--no-plots", action="store_true", help="headless: no canvas, the histograms saved for plot_results.py")
+    parser.add_argument("--histograms", default=None,
+                        help="save all the histograms there (default: histograms.root with --no-plots)")
+    args = parser.parse_args()
+
+    # the scripts use the same histogram names, keep them out of gDirectory
+    ROOT.TH1.AddDirectory(False)
+    analyses = [load(name) for name in args.analyses]
+    driver.run(args.input, analyses, step_size=args.step_size, matching_mode=args.matching, plots=not args.no_plots)
+    histogram_file = args.histograms or ("histograms.root" if args.no_plots else None)
+    if histogram_file is not None:
+        driver.save(histogram_file, args.analyses, analyses)
+        print("histograms saved in", histogram_file)
+
+
+if __name__ == "__main__":
+    main()
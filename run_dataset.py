@@ -0,0 +1,97 @@
+"""
+Runs the analyses on a dataset of miniTree files, e.g. the producer outputs of
+the out_reco_edm4hep inputs processed so far, with a cache of per-file results
+(pi0tools/results.py): only the files without a cached result are processed,
+then the results of all the files are merged into the cumulative histograms
+and the scripts finish and plot as after a single loop over the whole dataset.
+Re-running it as new files arrive processes only those.
+
+The cuts on the reco photon theta range use the range of the whole dataset,
+so a new file that widens it reprocesses the analyses that have one.
+
+    python run_dataset.py -i output/miniTree_*.root
+    python run_dataset.py -i output/*.root -a nreco_vs_dr --cell-size 0.02 --no-plots -j 4
+"""
+import argparse
+import multiprocessing
+import os
+
+import ROOT
+import run_analyses
+from pi0tools import acceptance, driver, reader, results
+
+
+def process_file(job):
+    # the results of the analyses on one file, into the cache
+    filename, todo, dataset, cell_size, matching_mode, step_size, cache_dir = job
+    ROOT.gROOT.SetBatch(True)
+    ROOT.TH1.AddDirectory(False)
+    cache = results.ResultCache(cache_dir)
+    analyses = [run_analyses.load(name) for name, key in todo]
+    initial = [results.snapshot(analysis) for analysis in analyses]
+    driver.setup(analyses, dataset, cell_size, matching_mode)
+    driver.loop(filename, analyses, step_size)
+    n_events = reader.num_entries(filename)
+    for (name, key), analysis, state in zip(todo, analyses, initial):
+        cache.store(key, results.capture(analysis, state, n_events))
+    return filename
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the analyses on a growing set of miniTrees, caching the results of each file",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-i", "--inputs", nargs="+", required=True, help="miniTree files, merged in this order")
+    parser.add_argument("-a", "--analyses", nargs="+", choices=list(run_analyses.ANALYSES),
+                        default=list(run_analyses.ANALYSES))
+    parser.add_argument("--cache", default="result_cache", help="directory of the per-file results")
+    parser.add_argument("--cell-size", type=float, default=None, help="ECAL cell size [m] (default: the one of each script)")
+    parser.add_argument("--matching", choices=["greedy", "optimal"], default=None,
+                        help="reco/gen matching (default: the one of each script, greedy)")
+    parser.add_argument("--step-size", type=int, default=reader.DEFAULT_STEP, help="events per chunk")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="worker processes for the files to process")
+    parser.add_argument("--no-plots", action="store_true", help="headless: no canvas, the histograms saved for plot_results.py")
+    parser.add_argument("--histograms", default=None,
+                        help="save all the merged histograms there (default: histograms.root with --no-plots)")
+    args = parser.parse_args()
+
+    if args.no_plots:
+        ROOT.gROOT.SetBatch(True)
+    ROOT.TH1.AddDirectory(False)
+    dataset = [os.path.abspath(filename) for filename in args.inputs]
+    cache = results.ResultCache(args.cache)
+
+    # the modules that get the merged results, set up for the dataset as for the per-file loops
+    analyses = [run_analyses.load(name) for name in args.analyses]
+    driver.setup(analyses, dataset, args.cell_size, args.matching)
+    keys = {(filename, name): cache.key(name, analysis, filename, dataset)
+            for filename in dataset for name, analysis in zip(args.analyses, analyses)}
+    cache.save_hashes()
+
+    jobs = []
+    for filename in dataset:
+        todo = [(name, keys[filename, name]) for name in args.analyses if keys[filename, name] not in cache]
+        if todo:
+            jobs.append((filename, todo, dataset, args.cell_size, args.matching, args.step_size, args.cache))
+    print(len(dataset), "files,", len(jobs), "to process")
+    if args.jobs > 1 and len(jobs) > 1:
+        with multiprocessing.get_context("spawn").Pool(min(args.jobs, len(jobs))) as pool:
+            for filename in pool.imap_unordered(process_file, jobs, chunksize=1):
+                print("processed", filename)
+    else:
+        for job in jobs:
+            print("processed", process_file(job))
+
+    for name, analysis in zip(args.analyses, analyses):
+        results.merge(analysis, (cache.load(keys[filename, name]) for filename in dataset))
+    photon_acceptance = acceptance.read(dataset)
+    print("dataset: {:.0f} events, reco photon theta in [{:.4f}, {:.4f}]".format(
+        photon_acceptance["nEvents"], photon_acceptance["thetaMin"], photon_acceptance["thetaMax"]))
+    driver.end(analyses, plots=not args.no_plots)
+    histogram_file = args.histograms or ("histograms.root" if args.no_plots else None)
+    if histogram_file is not None:
+        driver.save(histogram_file, args.analyses, analyses)
+        print("histograms saved in", histogram_file)
+
+
+if __name__ == "__main__":
+    main()
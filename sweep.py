@@ -0,0 +1,117 @@
+"""
+Cell-size sweep: runs the chosen analyses on several samples at once, one
+process per sample, each with its own ECAL cell size for the Delta R
+resolution lines. The plots of a sample go to <outdir>/<sample>/ and all the
+histograms are collected in <outdir>/sweep.root, as <sample>/<analysis>/<name>,
+for overlay plots.
+
+--plots background runs the event loops headless and makes the plots of each
+sample in a separate pool (--plot-jobs) as soon as its histograms are saved,
+while the other samples are still running; --plots none leaves them for
+plot_results.py.
+
+    python sweep.py
+    python sweep.py -s miniTree.root:0.005 miniTreeAM_modifEcal2.root:0.02 -a nreco_vs_dr
+    python sweep.py --plots background --plot-jobs 2
+"""
+import argparse
+import multiprocessing
+import os
+
+import ROOT
+import plot_results
+import run_analyses
+from pi0tools import driver
+
+# the four ECAL granularities (file:cell size in m)
+SAMPLES = ["miniTree.root:0.005", "miniTreeAM_modifEcal1.root:0.01",
+           "miniTreeAM_modifEcal1p5.root:0.015", "miniTreeAM_modifEcal2.root:0.02"]
+HISTOGRAM_FILE = "histograms.root"
+
+
+def parse_sample(text):
+    filename, cell_size = text.rsplit(":", 1)
+    return filename, float(cell_size)
+
+
+def sample_name(filename):
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def run_sample(job):
+    filename, cell_size, names, outdir, matching_mode, plots = job
+    workdir = os.path.join(outdir, sample_name(filename))
+    os.makedirs(workdir, exist_ok=True)
+    filename = os.path.abspath(filename)
+    os.chdir(workdir)  # the scripts save their plots in the current directory
+
+    ROOT.gROOT.SetBatch(True)
+    ROOT.TH1.AddDirectory(False)
+    analyses = [run_analyses.load(name) for name in names]
+    driver.run(filename, analyses, cell_size=cell_size, matching_mode=matching_mode, plots=plots)
+    driver.save(HISTOGRAM_FILE, names, analyses)
+    return os.path.join(workdir, HISTOGRAM_FILE)
+
+
+def plot_sample(histogram_file):
+    # the plots of a sample, made from its saved histograms next to them
+    os.chdir(os.path.dirname(histogram_file))
+    ROOT.gROOT.SetBatch(True)
+    ROOT.TH1.AddDirectory(False)
+    plot_results.plot_file(histogram_file)
+    return histogram_file
+
+
+def collect(histogram_files, output):
+    outfile = ROOT.TFile(output, "RECREATE")
+    for filename in histogram_files:
+        sample_dir = outfile.mkdir(os.path.basename(os.path.dirname(filename)))
+        infile = ROOT.TFile(filename)
+        for analysis_key in infile.GetListOfKeys():
+            analysis_dir = sample_dir.mkdir(analysis_key.GetName())
+            analysis_dir.cd()
+            for key in infile.Get(analysis_key.GetName()).GetListOfKeys():
+                key.ReadObj().Write(key.GetName())
+        infile.Close()
+    outfile.Close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the analyses on several cell-size samples in parallel",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-s", "--samples", nargs="+", default=SAMPLES, help="file:cell size [m] pairs")
+    parser.add_argument("-a", "--analyses", nargs="+", choices=list(run_analyses.ANALYSES),
+                        default=list(run_analyses.ANALYSES))
+    parser.add_argument("-o", "--outdir", default="sweep")
+    parser.add_argument("--matching", choices=["greedy", "optimal"], default=None, help="reco/gen matching")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: one per sample)")
+    parser.add_argument("--plots", choices=["inline", "background", "none"], default="inline",
+                        help="plots made by the event loop, by a separate pool from the saved histograms, or not at all")
+    parser.add_argument("--plot-jobs", type=int, default=1, help="worker processes of --plots background")
+    args = parser.parse_args()
+
+    # absolute paths, a worker running several samples changes directory
+    samples = [(os.path.abspath(filename), cell_size) for filename, cell_size in map(parse_sample, args.samples)]
+    outdir = os.path.abspath(args.outdir)
+    jobs = [(filename, cell_size, args.analyses, outdir, args.matching, args.plots == "inline")
+            for filename, cell_size in samples]
+    context = multiprocessing.get_context("spawn")
+    if args.plots == "background":
+        # each sample is plotted as soon as its loop is done, while the next ones run
+        with context.Pool(args.jobs or len(jobs)) as pool, context.Pool(args.plot_jobs) as plot_pool:
+            histogram_files, plotted = [], []
+            for histogram_file in pool.imap(run_sample, jobs, chunksize=1):
+                histogram_files.append(histogram_file)
+                plotted.append(plot_pool.apply_async(plot_sample, (histogram_file,)))
+            for result in plotted:
+                result.get()
+    else:
+        with context.Pool(args.jobs or len(jobs)) as pool:
+            histogram_files = pool.map(run_sample, jobs, chunksize=1)
+
+    collect(histogram_files, os.path.join(outdir, "sweep.root"))
+    print("histograms of", len(samples), "samples in", os.path.join(outdir, "sweep.root"))
+
+
+if __name__ == "__main__":
+    main()
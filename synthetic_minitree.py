@@ -0,0 +1,185 @@
+"""
+Writes synthetic miniTrees (pi0tools/synthetic.py): the outtree of the producer
+miniTreeForAnneMarie.py, with the same branches, types and order, the same
+hEvents/hPF*/hGen* histograms and acceptance directory, filled with toy
+Z -> tau tau events instead of the edm4hep files. For scaling and stress tests
+of the analyses at any number of events, photon multiplicity, pi0 fraction and
+cell size.
+
+The events are made in chunks of --chunk-size, each with its own random stream
+(seed, chunk index), so a file does not depend on -j: the workers write
+contiguous blocks of chunks to parts that are merged as the producer does.
+
+    python synthetic_minitree.py -n 1000000 -o synthetic_5mm --cell-size 0.005
+    python synthetic_minitree.py -n 10000000 -o synthetic_2cm --cell-size 0.02 --angles -j 8
+"""
+import argparse
+import math
+import multiprocessing
+import os
+import time
+
+import ROOT
+import numpy as np
+from pi0tools import hists, kinematics, synthetic
+
+TREE_NAME = "outtree"
+COLLECTIONS = ["photon", "genPhoton", "genPi0"]
+COMPONENTS = ["P", "E", "Px", "Py", "Pz", "M"]
+ANGLES = ["Theta", "Phi", "Eta"]
+INDEX_COMPONENTS = {"genPhoton": ["Pi0Index"], "genPi0": ["Photon1Index", "Photon2Index"]}
+SCALARS = ["beamE", "nPhotons", "nGenPhotons", "nGenPi0s", "nGenTaus", "nRecoTausHad"]
+CHUNK_SIZE = 100000
+
+
+def add_angles(columns):
+    for name in COLLECTIONS:
+        px, py, pz = (columns[name + comp].content for comp in ("Px", "Py", "Pz"))
+        columns[name + "Theta"] = columns[name + "Px"].with_content(kinematics.theta(px, py, pz))
+        columns[name + "Phi"] = columns[name + "Px"].with_content(kinematics.phi(px, py, pz))
+        columns[name + "Eta"] = columns[name + "Px"].with_content(kinematics.eta(px, py, pz))
+
+
+def write(filename, n_events, first_chunk=0, seed=1, chunk_size=CHUNK_SIZE, angles=False, report=True, **options):
+    """
+    n_events synthetic events, from chunk first_chunk on, written to filename as
+    the producer writes them, printing the count after each chunk if report.
+    options go to synthetic.generate.
+    """
+    outfile = ROOT.TFile(filename, "RECREATE")
+    tree = ROOT.TTree(TREE_NAME, "processed variables")
+    scalars = {}
+    for var in SCALARS:
+        scalars[var] = np.zeros(1)
+        tree.Branch(var, scalars[var], var + "/D")
+    components = COMPONENTS + (ANGLES if angles else [])
+    vector_branches = [(var, comp, "double") for var in COLLECTIONS for comp in components]
+    vector_branches += [(var, comp, "int") for var in INDEX_COMPONENTS for comp in INDEX_COMPONENTS[var]]
+    vectors = {}
+    for var, comp, vec_type in vector_branches:
+        vectors[var + comp] = ROOT.std.vector(vec_type)()
+        tree.Branch(var + comp, vectors[var + comp])
+
+    h_events = ROOT.TH1F("hEvents", "hEvents", 2, 0, 2)
+    h_pf = {name: ROOT.TH1F(name, "", 50, 0, 50)
+            for name in ("hPFMuonsE", "hPFElectronsE", "hPFPhotonsE", "hGenPhotonsE", "hGenPi0sE")}
+    theta_min, theta_max = math.inf, -math.inf
+    totals = {"nPhotons": 0, "nGenPhotons": 0, "nGenPi0s": 0}
+
+    done = 0
+    chunk = first_chunk
+    while done < n_events:
+        size = min(chunk_size, n_events - done)
+        rng = np.random.default_rng([seed, chunk])
+        columns = synthetic.generate(size, rng, **options)
+        if angles:
+            add_angles(columns)
+        photon_theta = kinematics.theta(*(columns["photon" + comp].content for comp in ("Px", "Py", "Pz")))
+        if len(photon_theta):
+            theta_min = min(theta_min, photon_theta.min())
+            theta_max = max(theta_max, photon_theta.max())
+        hists.fill(h_pf["hPFPhotonsE"], columns["photonE"].content)
+        hists.fill(h_pf["hGenPhotonsE"], columns["genPhotonE"].content)
+        hists.fill(h_pf["hGenPi0sE"], columns["genPi0E"].content)
+        for var in totals:
+            totals[var] += int(columns[var].sum())
+
+        # the vectors of a collection share their offsets: slices by python ints, cheapest to assign
+        groups = [(columns[var + "E"].offsets.tolist(),
+                   [(vectors[name + comp], columns[name + comp].content) for name, comp, vec_type in vector_branches if name == var])
+                  for var in COLLECTIONS]
+        scalar_columns = [(scalars[var], columns[var]) for var in SCALARS]
+        for i in range(size):
+            for offsets, vector_columns in groups:
+                first, last = offsets[i], offsets[i + 1]
+                for vector, content in vector_columns:
+                    vector.assign(content[first:last])
+            for value, values in scalar_columns:
+                value[0] = values[i]
+            tree.Fill()
+        done += size
+        chunk += 1
+        if report:
+            print(done, "events")
+
+    h_events.Fill(0, n_events)
+    h_events.Fill(1, n_events)
+    outfile.cd()
+    h_events.Write()
+    for hist in h_pf.values():
+        hist.Write()
+    tree.Write()
+    acceptance_dir = outfile.mkdir("acceptance")
+    acceptance_dir.cd()
+    acceptance = [("thetaMin", theta_min, "m"), ("thetaMax", theta_max, "M"), ("nEvents", n_events, "+"),
+                  ("nPhotons", totals["nPhotons"], "+"), ("nGenPhotons", totals["nGenPhotons"], "+"),
+                  ("nGenPi0s", totals["nGenPi0s"], "+")]
+    for name, value, merge_mode in acceptance:
+        ROOT.TParameter("double")(name, value, merge_mode).Write()
+    outfile.Close()
+    return filename
+
+
+def _write_part(job):
+    # the workers stay quiet, their counts would interleave: the parent reports the finished parts
+    k, filename, n_events, first_chunk, kwargs = job
+    write(filename, n_events, first_chunk, report=False, **kwargs)
+    return k, n_events
+
+
+def merge(input_names, filename):
+    # tree concatenated, histograms added, acceptance combined by merge mode (as the producer)
+    merger = ROOT.TFileMerger(False)
+    merger.OutputFile(filename, "RECREATE")
+    for name in input_names:
+        merger.AddFile(name)
+    if not merger.Merge():
+        raise RuntimeError("could not merge into " + filename)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic miniTree with the layout of the producer",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-n", "--events", type=int, default=100000)
+    parser.add_argument("-o", "--outfile", default="synthetic", help="written to OUTFILE.root")
+    parser.add_argument("--cell-size", type=float, default=0.005, help="ECAL cell size [m]")
+    parser.add_argument("--photons", type=float, default=synthetic.PHOTONS,
+                        help="mean gen photons per event (before the 0.1 GeV cut)")
+    parser.add_argument("--pi0-fraction", type=float, default=synthetic.PI0_FRACTION,
+                        help="fraction of these photons coming from pi0 decays")
+    parser.add_argument("--fakes", type=float, default=synthetic.FAKES, help="mean fake reco photons per event")
+    parser.add_argument("--angles", action="store_true", help="also write Theta, Phi and Eta, as the producer --angles")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="events generated at once")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="worker processes; each writes a part, merged at the end")
+    args = parser.parse_args()
+
+    filename = args.outfile + ".root"
+    kwargs = {"seed": args.seed, "chunk_size": args.chunk_size, "angles": args.angles, "cell_size": args.cell_size,
+              "photons": args.photons, "pi0_fraction": args.pi0_fraction, "fakes": args.fakes}
+    start = time.time()
+    n_chunks = -(-args.events // args.chunk_size)
+    n_jobs = max(1, min(args.jobs, n_chunks))
+    if n_jobs == 1:
+        write(filename, args.events, **kwargs)
+    else:
+        # contiguous blocks of chunks, so that the merged tree keeps the event order
+        bounds = np.linspace(0, n_chunks, n_jobs + 1).astype(int)
+        jobs = [(k, args.outfile + "_{}.root".format(k), min(bounds[k + 1] * args.chunk_size, args.events)
+                 - bounds[k] * args.chunk_size, bounds[k], kwargs) for k in range(n_jobs)]
+        parts = [job[1] for job in jobs]
+        done = 0
+        with multiprocessing.Pool(n_jobs) as pool:
+            for k, n_events in pool.imap_unordered(_write_part, jobs):
+                done += n_events
+                print("part {}/{}: {} events ({} of {})".format(k + 1, n_jobs, n_events, done, args.events))
+        merge(parts, filename)
+        for name in parts:
+            os.remove(name)
+    elapsed = time.time() - start
+    print("{} events written to {} in {:.1f} s ({:.0f} events/s)".format(args.events, filename, elapsed,
+                                                                       args.events / elapsed))
+
+
+if __name__ == "__main__":
+    main()